@@ -1,11 +1,11 @@
-from typing import Union, List, Set
+from typing import Union, List, Dict, Set, Tuple, Optional
 import datetime
-import time
 
 from mcim_sync.database.mongodb import raw_mongo_client
+from mcim_sync.utils import parse_datetime
 from mcim_sync.utils.loger import log
 from mcim_sync.config import Config
-from mcim_sync.models.database.curseforge import Mod, File
+from mcim_sync.models.database.curseforge import File
 from mcim_sync.sync.curseforge import (
     fetch_mutil_mods_info,
     fetch_mutil_files,
@@ -14,12 +14,26 @@ from mcim_sync.sync.curseforge import (
     ModsSearchSortOrder,
     ModsSearchSortField,
 )
+from mcim_sync.queues import reset_retry_attempts, retry_failed_lookup
 from mcim_sync.queues.curseforge import (
+    MODIDS_QUEUE_KEY,
+    FILEIDS_QUEUE_KEY,
+    FINGERPRINTS_QUEUE_KEY,
     fetch_curseforge_modids_queue,
     fetch_curseforge_fileids_queue,
     fetch_curseforge_fingerprints_queue,
 )
 from mcim_sync.utils.model_submitter import ModelSubmitter
+from mcim_sync.utils.known_ids import curseforge_known_modids
+from mcim_sync.utils.negative_cache import (
+    curseforge_missing_modids,
+    curseforge_missing_fileids,
+    curseforge_missing_fingerprints,
+)
+from mcim_sync.cursors.curseforge import (
+    get_curseforge_newest_cursor,
+    set_curseforge_newest_cursor,
+)
 
 config = Config.load()
 
@@ -29,65 +43,140 @@ MAX_WORKERS: int = config.max_workers
 
 CURSEFORGE_DELAY: Union[float, int] = config.curseforge_delay
 
-def check_curseforge_data_updated(mods: List[Mod]) -> Set[int]:
-    mod_date = {mod.id: {"sync_date": mod.dateModified} for mod in mods}
-    expired_modids: Set[int] = set()
-    mods_info = fetch_mutil_mods_info(modIds=[mod.id for mod in mods])
+# 搜索接口最多能翻到的结果数
+SEARCH_WINDOW_SIZE = 10000
+UPDATED_SEARCH_LAG_MARGIN: int = config.updated_search_lag_margin
+
+# 检查更新只需要比较 dateModified，其余字段不必从数据库读出
+CURSEFORGE_CHECK_PROJECTION = {"_id": 1, "dateModified": 1}
+
+
+def check_curseforge_data_updated(
+    mods: List[dict],
+) -> Tuple[Dict[int, dict], Set[int]]:
+    """
+    mods 为按 CURSEFORGE_CHECK_PROJECTION 投影的原始文档
+
+    返回过期的 modid 及其刚拉取到的 Mod 信息，供 sync_mod 直接使用，
+    以及批量接口没有返回的 modid（可能已经被删除，需要进一步确认）
+    """
+    mod_date = {
+        mod["_id"]: {"sync_date": parse_datetime(mod.get("dateModified"))}
+        for mod in mods
+    }
+    expired_modids: Dict[int, dict] = {}
+    missing_modids: Set[int] = set()
+    mods_info = fetch_mutil_mods_info(modIds=list(mod_date.keys()))
     if mods_info is not None:
+        missing_modids = set(mod_date.keys()) - {mod["id"] for mod in mods_info}
         # with ModelSubmitter() as submitter:
         for mod in mods_info:
             # submitter.add(Mod(**mod))
             modid = mod["id"]
             mod_date[modid]["source_date"] = mod["dateModified"]
-            sync_date: datetime.datetime = mod_date[modid]["sync_date"].replace( # type: ignore
-                tzinfo=None
-            )
             dateModified_date = datetime.datetime.fromisoformat(
                 mod["dateModified"]
             ).replace(tzinfo=None)
+            if mod_date[modid]["sync_date"] is None:
+                expired_modids[modid] = mod
+                log.debug(f"Mod {modid} has no local dateModified, needs sync!")
+                continue
+            sync_date: datetime.datetime = mod_date[modid]["sync_date"]
             if int(sync_date.timestamp()) == int(dateModified_date.timestamp()):
                 log.trace(f"Mod {modid} is not updated, pass!")
             else:
-                expired_modids.add(modid)
+                expired_modids[modid] = mod
                 log.debug(
                     f"Mod {modid} is updated {sync_date.isoformat(timespec='seconds')} -> {dateModified_date.isoformat(timespec='seconds')}!"
                 )
 
-    return expired_modids
+    return expired_modids, missing_modids
+
 
 
+def fetch_curseforge_mods_info(modids: List[int]) -> Dict[int, dict]:
+    """
+    按 CURSEFORGE_LIMIT_SIZE 分块批量拉取 Mod 信息，返回 modid -> Mod 信息
+    """
+    mods_info: Dict[int, dict] = {}
+    modids = list(set(modids))
+    for i in range(0, len(modids), CURSEFORGE_LIMIT_SIZE):
+        chunk = modids[i : i + CURSEFORGE_LIMIT_SIZE]
+        info = fetch_mutil_mods_info(modIds=chunk)
+        if info is not None:
+            mods_info.update({mod["id"]: mod for mod in info})
+    return mods_info
+
 
 # check curseforge_modids queue
-def check_curseforge_modids_available():
+def check_curseforge_modids_available() -> Dict[int, dict]:
     """
-    返回对应的 modids
+    返回对应的 modid 及其 Mod 信息
+
+    跳过负缓存中的 modid，批量接口没有返回的 modid 加入负缓存
     """
-    available_modids = []
-    modids = fetch_curseforge_modids_queue()
-    log.info(f"Fetched {len(modids)} curseforge modids from queue")
+    queue_modids = fetch_curseforge_modids_queue()
+    log.info(f"Fetched {len(queue_modids)} curseforge modids from queue")
+    modids = curseforge_missing_modids.filter(queue_modids)
 
+    mods_info: Dict[int, dict] = {}
+    missing_modids = []
     for i in range(0, len(modids), CURSEFORGE_LIMIT_SIZE):
         chunk = modids[i : i + CURSEFORGE_LIMIT_SIZE]
         info = fetch_mutil_mods_info(modIds=chunk)
         if info is not None:
-            available_modids.extend([mod["id"] for mod in info])
-    return list(set(available_modids))
+            mods_info.update({mod["id"]: mod for mod in info})
+            missing_modids.extend(modid for modid in chunk if modid not in mods_info)
+        else:
+            retry_failed_lookup(MODIDS_QUEUE_KEY, chunk)
+    curseforge_missing_modids.add(missing_modids)
+    # 确认不存在的 modid 清除失败次数，找到的由同步结果决定
+    cached_modids = set(queue_modids) - set(modids)
+    reset_retry_attempts(MODIDS_QUEUE_KEY, list(cached_modids) + missing_modids)
+    return mods_info
+
+
+def resolve_curseforge_files_locally(field: str, values: List[int]) -> List[int]:
+    """
+    按 _id 或 fileFingerprint 在 curseforge_files 中批量查找已缓存的文件
+
+    已缓存的文件不需要再同步所属的 mod，只返回需要请求上游的值
+    """
+    found = set()
+    for i in range(0, len(values), CURSEFORGE_LIMIT_SIZE):
+        chunk = values[i : i + CURSEFORGE_LIMIT_SIZE]
+        for file in raw_mongo_client["curseforge_files"].find(
+            {field: {"$in": chunk}}, {field: 1}
+        ):
+            found.add(file[field])
+    log.debug(f"Resolved {len(found)} of {len(values)} curseforge {field} locally")
+    return [value for value in values if value not in found]
 
 
 # check curseforge_fileids queue
 def check_curseforge_fileids_available():
     """
     返回对应的 modids
+
+    已缓存的文件直接跳过，只有未缓存的才请求上游并同步所属的 mod
     """
+    queue_fileids = fetch_curseforge_fileids_queue()
+    log.info(f"Fetched {len(queue_fileids)} curseforge fileids from queue")
     available_modids = []
-    fileids = fetch_curseforge_fileids_queue()
-    log.info(f"Fetched {len(fileids)} curseforge fileids from queue")
+    failed_fileids = set()
+    fileids = resolve_curseforge_files_locally("_id", queue_fileids)
+    fileids = curseforge_missing_fileids.filter(fileids)
 
+    missing_fileids = []
     for i in range(0, len(fileids), CURSEFORGE_LIMIT_SIZE):
         chunk = fileids[i : i + CURSEFORGE_LIMIT_SIZE]
         info = fetch_mutil_files(fileIds=chunk)
         if info is not None:
             available_modids.extend([file["modId"] for file in info])
+            found_fileids = {file["id"] for file in info}
+            missing_fileids.extend(
+                fileid for fileid in chunk if fileid not in found_fileids
+            )
 
             # https://github.com/Meloong-Git/PCL/issues/8008#issuecomment-4252789454
             # 特判：如果文件不可见，那么强行在此插入数据库，以及后续 sync_mod 应该不删除该文件
@@ -96,6 +185,15 @@ def check_curseforge_fileids_available():
                     if not file["isAvailable"]:
                         submitter.add(File(**file))
                         log.debug(f"FileId {file['id']} modId {file['modId']} is not available! Specially inserted into database.")
+        else:
+            retry_failed_lookup(FILEIDS_QUEUE_KEY, chunk)
+            failed_fileids.update(chunk)
+    curseforge_missing_fileids.add(missing_fileids)
+    # 已缓存、查到或者确认不存在的 fileid 清除失败次数
+    reset_retry_attempts(
+        FILEIDS_QUEUE_KEY,
+        [fileid for fileid in queue_fileids if fileid not in failed_fileids],
+    )
 
     return list(set(available_modids))
 
@@ -104,10 +202,17 @@ def check_curseforge_fileids_available():
 def check_curseforge_fingerprints_available():
     """
     返回对应的 modids
+
+    已缓存的文件直接跳过，只有未缓存的才请求上游并同步所属的 mod
     """
+    queue_fingerprints = fetch_curseforge_fingerprints_queue()
+    log.info(f"Fetched {len(queue_fingerprints)} curseforge fingerprints from queue")
     available_modids = []
-    fingerprints = fetch_curseforge_fingerprints_queue()
-    log.info(f"Fetched {len(fingerprints)} curseforge fingerprints from queue")
+    failed_fingerprints = set()
+    fingerprints = resolve_curseforge_files_locally(
+        "fileFingerprint", queue_fingerprints
+    )
+    fingerprints = curseforge_missing_fingerprints.filter(fingerprints)
 
     for i in range(0, len(fingerprints), CURSEFORGE_LIMIT_SIZE):
         chunk = fingerprints[i : i + CURSEFORGE_LIMIT_SIZE]
@@ -116,6 +221,21 @@ def check_curseforge_fingerprints_available():
             available_modids.extend(
                 [fingerprint["file"]["modId"] for fingerprint in info["exactMatches"]]
             )
+            curseforge_missing_fingerprints.add(
+                info.get("unmatchedFingerprints") or []
+            )
+        else:
+            retry_failed_lookup(FINGERPRINTS_QUEUE_KEY, chunk)
+            failed_fingerprints.update(chunk)
+    # 已缓存、查到或者确认不存在的 fingerprint 清除失败次数
+    reset_retry_attempts(
+        FINGERPRINTS_QUEUE_KEY,
+        [
+            fingerprint
+            for fingerprint in queue_fingerprints
+            if fingerprint not in failed_fingerprints
+        ],
+    )
     return list(set(available_modids))
 
 
@@ -123,55 +243,203 @@ def check_new_modids(modids: List[int]) -> List[int]:
     """
     返回对应的 modids
     """
-    find_result = raw_mongo_client["curseforge_mods"].find(
-        {"_id": {"$in": modids}}, {"_id": 1}
-    )
-    found_modids = [mod["_id"] for mod in find_result]
-    return list(set(modids) - set(found_modids))
+    return curseforge_known_modids.filter_unknown(modids)
+
 
 
+def _parse_mod_released_date(mod: dict) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(
+        mod.get("dateReleased") or mod["dateCreated"]
+    ).replace(tzinfo=None)
 
-def check_newest_search_result(gameId: int, classId: int) -> List[int]:
+
+def check_newest_search_result(gameId: int, classId: int) -> Dict[int, dict]:
     """
-    遍历搜索返回值直到出现第一个已缓存的 modid，然后返回所有捕捉到的新 modid
+    按 ReleasedDate 倒序遍历搜索结果，直到越过上次保存的游标，然后返回所有捕捉到的新 modid
+    及其搜索结果中的 Mod 信息，供 sync_mod 直接使用
+
+    没有游标时遍历到第一个已缓存的 modid 为止
+    翻页之间不再 sleep，请求频率由域名限速控制，以便各分类并发搜索
+    只有完整遍历到游标（或者结果末尾）时才保存新的游标，请求失败或者超出搜索窗口时
+    保留旧游标，下次重新遍历，不会跳过中间没见到的 mod
     """
-    new_modids = []
+    new_mods: Dict[int, dict] = {}
     index = 0
     page_size = 50
+    cursor = get_curseforge_newest_cursor(gameId, classId)
+    newest: Optional[Tuple[int, datetime.datetime]] = None
+    completed = False
 
-    while index + page_size <= 10000:
+    while index + page_size <= SEARCH_WINDOW_SIZE:
         res = fetch_search_result(
             gameId=gameId, classId=classId, index=index, pageSize=page_size,
             sortField=ModsSearchSortField.ReleasedDate,
             sortOrder=ModsSearchSortOrder.DESC,
         )
-        
+
+        if res is None:
+            log.warning(
+                f"Failed to fetch newest search result at index {index} for gameId {gameId} classId {classId}"
+            )
+            break
         if res["pagination"]["resultCount"] == 0:
+            completed = True
             break
 
-        temp_modids = [mod["id"] for mod in res["data"]]
+        if newest is None:
+            newest = (res["data"][0]["id"], _parse_mod_released_date(res["data"][0]))
 
-        # 检查哪些 mod 已经在数据库中
-        existing_mods = set(
-            doc["_id"] for doc in raw_mongo_client["curseforge_mods"].find(
-                {"_id": {"$in": temp_modids}}, 
-                {"_id": 1}
-            )
-        )
+        if cursor is not None:
+            cursor_modid, cursor_date = cursor
+            reached_cursor = False
+            for mod in res["data"]:
+                if mod["id"] == cursor_modid or _parse_mod_released_date(mod) < cursor_date:
+                    reached_cursor = True
+                else:
+                    new_mods[mod["id"]] = mod
+
+            # 整页检查完再停止，已缓存的 mod 乱序出现在游标之前也不会提前停止
+            if reached_cursor:
+                log.debug(f"Reached cursor {cursor_modid} at index {index}")
+                completed = True
+                break
+
+            index += page_size
+            continue
+
+        temp_mods = {mod["id"]: mod for mod in res["data"]}
+
+        # 检查哪些 mod 还没有缓存
+        new_ids = check_new_modids(list(temp_mods.keys()))
 
         # 如果找到任何已存在的 mod，停止搜索
-        if existing_mods:
-            new_ids = [mid for mid in temp_modids if mid not in existing_mods]
-            new_modids.extend(new_ids)
+        if len(new_ids) < len(temp_mods):
+            new_mods.update({modid: temp_mods[modid] for modid in new_ids})
             log.debug(f"Found {len(new_ids)} new modids at index {index}")
+            completed = True
             break
 
         # 如果所有 mod 都是新的，添加它们并继续搜索
-        new_modids.extend(temp_modids)
-        log.debug(f"Found {len(temp_modids)} new modids at index {index}")
+        new_mods.update(temp_mods)
+        log.debug(f"Found {len(temp_mods)} new modids at index {index}")
+
+        index += page_size
+    else:
+        log.warning(
+            f"Search window of {SEARCH_WINDOW_SIZE} results exhausted for gameId {gameId} classId {classId}, some new mods may be missed"
+        )
+
+    if cursor is not None:
+        # 游标之前也可能有已缓存的 mod，统一过滤一次
+        new_mods = {
+            modid: new_mods[modid]
+            for modid in check_new_modids(list(new_mods.keys()))
+        }
+
+    if completed and newest is not None:
+        set_curseforge_newest_cursor(gameId, classId, *newest)
+    elif not completed:
+        log.warning(
+            f"Newest search walk incomplete for gameId {gameId} classId {classId}, keep the previous cursor"
+        )
+
+    return new_mods
+
+
+def _filter_unsynced_mods(mods_date: Dict[int, datetime.datetime]) -> List[int]:
+    """
+    返回本地 dateModified 与搜索结果不一致的 modid
+    """
+    local_date = {
+        mod["_id"]: mod.get("dateModified")
+        for mod in raw_mongo_client["curseforge_mods"].find(
+            {"_id": {"$in": list(mods_date.keys())}}, CURSEFORGE_CHECK_PROJECTION
+        )
+    }
+    unsynced_modids = []
+    for modid, date_modified in mods_date.items():
+        sync_date = parse_datetime(local_date.get(modid))
+        if sync_date is None or int(sync_date.timestamp()) != int(
+            date_modified.timestamp()
+        ):
+            unsynced_modids.append(modid)
+    return unsynced_modids
+
+
+def check_updated_search_result(
+    gameId: int, classId: int, watermark: datetime.datetime
+) -> Tuple[Dict[int, dict], Optional[datetime.datetime]]:
+    """
+    按 LastUpdated 倒序遍历搜索结果，直到 dateModified 早于 watermark 减去延迟余量
+
+    搜索索引可能晚于实际更新，余量内的 mod 与本地 dateModified 对比，不一致的才同步
+    翻页之间不 sleep，请求频率由域名限速控制
+
+    返回期间更新过的 modid 及其搜索结果中的 Mod 信息；
+    只有完整遍历到水位线时才返回见到的最新 dateModified，
+    请求失败或者超出搜索窗口时返回 None，由调用方保留旧水位线
+    """
+    threshold = watermark - datetime.timedelta(seconds=UPDATED_SEARCH_LAG_MARGIN)
+    updated_mods: Dict[int, dict] = {}
+    lagged_mods: Dict[int, dict] = {}
+    lagged_dates: Dict[int, datetime.datetime] = {}
+    newest_date: Optional[datetime.datetime] = None
+    completed = False
+    index = 0
+    page_size = 50
+
+    while index + page_size <= SEARCH_WINDOW_SIZE:
+        res = fetch_search_result(
+            gameId=gameId, classId=classId, index=index, pageSize=page_size,
+            sortField=ModsSearchSortField.LastUpdated,
+            sortOrder=ModsSearchSortOrder.DESC,
+        )
+
+        if res is None:
+            log.warning(
+                f"Failed to fetch updated search result at index {index} for gameId {gameId} classId {classId}"
+            )
+            break
+        if res["pagination"]["resultCount"] == 0:
+            completed = True
+            break
+
+        reached_watermark = False
+        for mod in res["data"]:
+            date_modified = datetime.datetime.fromisoformat(
+                mod["dateModified"]
+            ).replace(tzinfo=None)
+            if newest_date is None or date_modified > newest_date:
+                newest_date = date_modified
+            if date_modified > watermark:
+                updated_mods[mod["id"]] = mod
+            elif date_modified > threshold:
+                lagged_mods[mod["id"]] = mod
+                lagged_dates[mod["id"]] = date_modified
+            else:
+                reached_watermark = True
+
+        # 整页检查完再停止，避免同一页内排序不严格时漏掉
+        if reached_watermark:
+            completed = True
+            break
 
         index += page_size
+    else:
+        log.warning(
+            f"Search window exhausted before reaching watermark {watermark.isoformat()} for gameId {gameId} classId {classId}"
+        )
 
-        time.sleep(CURSEFORGE_DELAY)
+    if lagged_dates:
+        for modid in _filter_unsynced_mods(lagged_dates):
+            updated_mods.setdefault(modid, lagged_mods[modid])
 
-    return new_modids
\ No newline at end of file
+    log.debug(
+        f"Found {len(updated_mods)} updated modids since {watermark.isoformat()} for gameId {gameId} classId {classId}"
+    )
+    if not completed:
+        log.warning(
+            f"Updated search walk incomplete for gameId {gameId} classId {classId}, keep the previous watermark"
+        )
+        return updated_mods, None
+    return updated_mods, newest_date
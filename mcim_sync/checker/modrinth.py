@@ -1,16 +1,31 @@
-from typing import Union, List, Set, Tuple
+from typing import Union, List, Dict, Set, Tuple, Optional
 import datetime
 
 from mcim_sync.database.mongodb import raw_mongo_client
+from mcim_sync.utils import parse_datetime
 from mcim_sync.utils.loger import log
 from mcim_sync.config import Config
-from mcim_sync.models.database.modrinth import Project
 from mcim_sync.utils.model_submitter import ModelSubmitter
+from mcim_sync.utils.known_ids import modrinth_known_project_ids
+from mcim_sync.utils.negative_cache import (
+    modrinth_missing_project_ids,
+    modrinth_missing_version_ids,
+    modrinth_missing_hashes,
+)
 
+from mcim_sync.queues import reset_retry_attempts, retry_failed_lookup
 from mcim_sync.queues.modrinth import (
+    PROJECT_IDS_QUEUE_KEY,
+    VERSION_IDS_QUEUE_KEY,
+    hashes_queue_key,
     fetch_modrinth_project_ids_queue,
     fetch_modrinth_version_ids_queue,
     fetch_modrinth_hashes_queue,
+    HASH_ALGORITHMS,
+)
+from mcim_sync.cursors.modrinth import (
+    get_modrinth_newest_cursor,
+    set_modrinth_newest_cursor,
 )
 from mcim_sync.sync.modrinth import (
     fetch_mutil_projects_info,
@@ -26,29 +41,42 @@ MAX_WORKERS: int = config.max_workers
 
 MODRINTH_DELAY: Union[float, int] = config.modrinth_delay
 
+# 搜索接口最多能翻到的结果数
+SEARCH_WINDOW_SIZE = 10000
+UPDATED_SEARCH_LAG_MARGIN: int = config.updated_search_lag_margin
+
+
+
 
+# 检查更新只需要比较以下字段，不读取 body 等大字段
+MODRINTH_CHECK_PROJECTION = {"_id": 1, "updated": 1, "versions": 1, "game_versions": 1}
 
 
 def check_modrinth_data_updated_and_alive(
-    projects: List[Project],
-) -> Tuple[Set[str], Set[str]]:
+    projects: List[dict],
+) -> Tuple[Dict[str, dict], Set[str]]:
+    """
+    projects 为按 MODRINTH_CHECK_PROJECTION 投影的原始文档
+
+    返回过期的 project_id 及其刚拉取到的 Project 信息，以及源已删除的 project_id
+    """
     local_project_info = {
-        project.id: {
-            "updated": project.updated.replace(tzinfo=None),
-            "versions": project.versions,
-            "game_versions": project.game_versions,
+        project["_id"]: {
+            "updated": parse_datetime(project.get("updated")),
+            "versions": project.get("versions"),
+            "game_versions": project.get("game_versions"),
         }
         for project in projects
     }
 
     all_project_ids = list(local_project_info.keys())
-    outdated_ids: Set[str] = set()
+    outdated_ids: Dict[str, dict] = {}
     alive_ids: Set[str] = set()
 
     remote_projects = fetch_mutil_projects_info(project_ids=all_project_ids)
 
     if remote_projects is None:
-        return set(), set()
+        return {}, set()
 
     # with ModelSubmitter() as submitter:
     for remote in remote_projects:
@@ -71,13 +99,13 @@ def check_modrinth_data_updated_and_alive(
         if _is_project_updated(
             local_updated, remote_updated
         ):  # Check if project is updated
-            outdated_ids.add(project_id)
+            outdated_ids[project_id] = remote
             log.debug(f"[{project_id}] Updated: {local_updated} → {remote_updated}")
         elif _has_versions_changed(
             local_versions, remote_versions
         ):  # Check if versions have changed
-            outdated_ids.add(project_id)
-            diff_versions = set(remote_versions) ^ set(local_versions)
+            outdated_ids[project_id] = remote
+            diff_versions = set(remote_versions) ^ set(local_versions or [])
             if diff_versions:
                 log.debug(
                     f"[{project_id}] Version {diff_versions} mismatch, needs sync."
@@ -85,9 +113,9 @@ def check_modrinth_data_updated_and_alive(
         elif _has_game_versions_changed(
             local_game_versions, remote_game_versions
         ):  # Check if game versions have changed
-            outdated_ids.add(project_id)
+            outdated_ids[project_id] = remote
             diff_game_versions = set(remote_game_versions) ^ set(
-                local_game_versions
+                local_game_versions or []
             )
             if diff_game_versions:
                 log.debug(
@@ -105,53 +133,142 @@ def check_modrinth_data_updated_and_alive(
     return outdated_ids, dead_ids
 
 
-def _is_project_updated(local: datetime.datetime, remote: datetime.datetime) -> bool:
+def _is_project_updated(
+    local: Optional[datetime.datetime], remote: datetime.datetime
+) -> bool:
+    if local is None:
+        return True
     return int(local.timestamp()) != int(remote.timestamp())
 
 
 def _has_versions_changed(
-    local_versions: List[str], remote_versions: List[str]
+    local_versions: Optional[List[str]], remote_versions: List[str]
 ) -> bool:
     return local_versions != remote_versions
 
 
 def _has_game_versions_changed(
-    local_game_versions: List[str], remote_game_versions: List[str]
+    local_game_versions: Optional[List[str]], remote_game_versions: List[str]
 ) -> bool:
     return local_game_versions != remote_game_versions
 
 
+def fetch_modrinth_projects_info(project_ids: List[str]) -> Dict[str, dict]:
+    """
+    按 MODRINTH_LIMIT_SIZE 分块批量拉取 Project 信息，返回 project_id -> Project 信息
+    """
+    projects_info: Dict[str, dict] = {}
+    project_ids = list(set(project_ids))
+    for i in range(0, len(project_ids), MODRINTH_LIMIT_SIZE):
+        chunk = project_ids[i : i + MODRINTH_LIMIT_SIZE]
+        info = fetch_mutil_projects_info(project_ids=chunk)
+        if info is not None:
+            projects_info.update({project["id"]: project for project in info})
+    return projects_info
+
+
 # check modrinth_project_ids queue
-def check_modrinth_project_ids_available():
+def check_modrinth_project_ids_available() -> Dict[str, dict]:
     """
-    返回对应的 project_ids
+    返回对应的 project_id 及其 Project 信息
+
+    跳过负缓存中的 project_id，批量接口没有返回的加入负缓存
     """
-    available_project_ids = []
-    project_ids = fetch_modrinth_project_ids_queue()
-    log.info(f"Fetched {len(project_ids)} modrinth project ids from queue")
+    queue_project_ids = fetch_modrinth_project_ids_queue()
+    log.info(f"Fetched {len(queue_project_ids)} modrinth project ids from queue")
+    project_ids = modrinth_missing_project_ids.filter(queue_project_ids)
 
+    projects_info: Dict[str, dict] = {}
+    missing_project_ids = []
     for i in range(0, len(project_ids), MODRINTH_LIMIT_SIZE):
         chunk = project_ids[i : i + MODRINTH_LIMIT_SIZE]
         info = fetch_mutil_projects_info(project_ids=chunk)
         if info is not None:
-            available_project_ids.extend([project["id"] for project in info])
-    return list(set(available_project_ids))
+            projects_info.update({project["id"]: project for project in info})
+            # 队列中也可能是 slug
+            found = {project["id"] for project in info} | {
+                project["slug"] for project in info
+            }
+            missing_project_ids.extend(
+                project_id for project_id in chunk if project_id not in found
+            )
+        else:
+            retry_failed_lookup(PROJECT_IDS_QUEUE_KEY, chunk)
+    modrinth_missing_project_ids.add(missing_project_ids)
+    # 确认不存在的 project_id 清除失败次数，找到的由同步结果决定
+    cached_project_ids = set(queue_project_ids) - set(project_ids)
+    reset_retry_attempts(
+        PROJECT_IDS_QUEUE_KEY, list(cached_project_ids) + missing_project_ids
+    )
+    return projects_info
+
+
+def resolve_modrinth_locally(
+    collection: str, field: str, values: List[str]
+) -> Tuple[List[str], List[str]]:
+    """
+    按 field 在 collection 中批量查找已缓存的 version 或文件
+
+    返回找到的 project_ids，以及需要请求上游的值
+    """
+    project_ids = set()
+    found = set()
+    # _id.sha1 这样的嵌套字段按路径取值
+    path = field.split(".")
+    for i in range(0, len(values), MODRINTH_LIMIT_SIZE):
+        chunk = values[i : i + MODRINTH_LIMIT_SIZE]
+        for document in raw_mongo_client[collection].find(
+            {field: {"$in": chunk}}, {field: 1, "project_id": 1}
+        ):
+            project_ids.add(document["project_id"])
+            value = document
+            for key in path:
+                value = value[key]
+            found.add(value)
+    log.debug(f"Resolved {len(found)} of {len(values)} modrinth {field} locally")
+    return list(project_ids), [value for value in values if value not in found]
 
 
 # check modrinth_version_ids queue
 def check_modrinth_version_ids_available():
     """
     返回对应的 project_ids
+
+    已缓存的 version 直接从数据库得到 project_id，只有未缓存的才请求上游
     """
-    available_project_ids = []
-    version_ids = fetch_modrinth_version_ids_queue()
-    log.info(f"Fetched {len(version_ids)} modrinth version ids from queue")
+    queue_version_ids = fetch_modrinth_version_ids_queue()
+    log.info(f"Fetched {len(queue_version_ids)} modrinth version ids from queue")
+    available_project_ids, version_ids = resolve_modrinth_locally(
+        "modrinth_versions", "_id", queue_version_ids
+    )
+    version_ids = modrinth_missing_version_ids.filter(version_ids)
 
+    missing_version_ids = []
+    failed_version_ids = set()
     for i in range(0, len(version_ids), MODRINTH_LIMIT_SIZE):
         chunk = version_ids[i : i + MODRINTH_LIMIT_SIZE]
         info = fetch_multi_versions_info(version_ids=chunk)
         if info is not None:
             available_project_ids.extend([version["project_id"] for version in info])
+            found_version_ids = {version["id"] for version in info}
+            missing_version_ids.extend(
+                version_id
+                for version_id in chunk
+                if version_id not in found_version_ids
+            )
+        else:
+            retry_failed_lookup(VERSION_IDS_QUEUE_KEY, chunk)
+            failed_version_ids.update(chunk)
+    modrinth_missing_version_ids.add(missing_version_ids)
+    # 已缓存、查到或者确认不存在的 version_id 清除失败次数
+    reset_retry_attempts(
+        VERSION_IDS_QUEUE_KEY,
+        [
+            version_id
+            for version_id in queue_version_ids
+            if version_id not in failed_version_ids
+        ],
+    )
     return list(set(available_project_ids))
 
 
@@ -159,13 +276,22 @@ def check_modrinth_version_ids_available():
 def check_modrinth_hashes_available():
     """
     返回对应的 project_ids
+
+    已缓存的文件直接从数据库得到 project_id，只有未缓存的才请求上游
     """
     available_project_ids = []
-    algorithms = ["sha1", "sha256"]
-    for algorithm in algorithms:
-        hashes = fetch_modrinth_hashes_queue(algorithm)
-        log.info(f"Fetched {len(hashes)} modrinth hashes from queue")
+    for algorithm in HASH_ALGORITHMS:
+        queue_hashes = fetch_modrinth_hashes_queue(algorithm)
+        log.info(f"Fetched {len(queue_hashes)} modrinth {algorithm} hashes from queue")
+        # modrinth_files 以 hashes 为主键
+        local_project_ids, hashes = resolve_modrinth_locally(
+            "modrinth_files", f"_id.{algorithm}", queue_hashes
+        )
+        available_project_ids.extend(local_project_ids)
+        hashes = modrinth_missing_hashes[algorithm].filter(hashes)
 
+        missing_hashes = []
+        failed_hashes = set()
         for i in range(0, len(hashes), MODRINTH_LIMIT_SIZE):
             chunk = hashes[i : i + MODRINTH_LIMIT_SIZE]
             info = fetch_multi_hashes_info(hashes=chunk, algorithm=algorithm)
@@ -173,6 +299,16 @@ def check_modrinth_hashes_available():
                 available_project_ids.extend(
                     [hash["project_id"] for hash in info.values()]
                 )
+                missing_hashes.extend(hash for hash in chunk if hash not in info)
+            else:
+                retry_failed_lookup(hashes_queue_key(algorithm), chunk)
+                failed_hashes.update(chunk)
+        modrinth_missing_hashes[algorithm].add(missing_hashes)
+        # 已缓存、查到或者确认不存在的 hash 清除失败次数
+        reset_retry_attempts(
+            hashes_queue_key(algorithm),
+            [hash for hash in queue_hashes if hash not in failed_hashes],
+        )
     return list(set(available_project_ids))
 
 
@@ -180,40 +316,69 @@ def check_new_project_ids(project_ids: List[str]) -> List[str]:
     """
     返回对应的 project_ids
     """
-    find_result = raw_mongo_client["modrinth_projects"].find(
-        {"_id": {"$in": project_ids}}, {"_id": 1}
-    )
-    found_project_ids = [project["_id"] for project in find_result]
-    return list(set(project_ids) - set(found_project_ids))
+    return modrinth_known_project_ids.filter_unknown(project_ids)
 
 
 def check_newest_search_result() -> List[str]:
     """
-    遍历 newest search result 直到出现第一个已缓存的 project_id，然后返回所有 new project_id
+    遍历 newest search result 直到越过上次保存的游标，然后返回所有 new project_id
+
+    没有游标时遍历到第一个已缓存的 project_id 为止
+    只有完整遍历到游标（或者结果末尾）时才保存新的游标，请求失败或者超出搜索窗口时
+    保留旧游标，下次重新遍历，不会跳过中间没见到的 project
     """
     new_project_ids = []
     offset = 0
     limit = 100
+    cursor = get_modrinth_newest_cursor()
+    newest: Optional[Tuple[str, datetime.datetime]] = None
+    completed = False
 
-    while True:
+    while offset + limit <= SEARCH_WINDOW_SIZE:
         res = fetch_search_result(offset=offset, index="newest", limit=limit)
-        if not res or not res["hits"] or len(res["hits"]) == 0:
+        if res is None:
+            log.warning(f"Failed to fetch newest search result at offset {offset}")
             break
+        if not res["hits"]:
+            completed = True
+            break
+
+        if newest is None:
+            newest = (
+                res["hits"][0]["project_id"],
+                _parse_date(res["hits"][0]["date_created"]),
+            )
+
+        if cursor is not None:
+            cursor_project_id, cursor_date = cursor
+            reached_cursor = False
+            for project in res["hits"]:
+                if (
+                    project["project_id"] == cursor_project_id
+                    or _parse_date(project["date_created"]) < cursor_date
+                ):
+                    reached_cursor = True
+                else:
+                    new_project_ids.append(project["project_id"])
+
+            # 整页检查完再停止，已缓存的 project 乱序出现在游标之前也不会提前停止
+            if reached_cursor:
+                log.debug(f"Reached cursor {cursor_project_id} at offset {offset}")
+                completed = True
+                break
+
+            offset += limit
+            continue
 
         temp_project_ids = [project["project_id"] for project in res["hits"]]
 
-        # Check which projects are already in database
-        existing_projects = set(
-            doc["_id"]
-            for doc in raw_mongo_client["modrinth_projects"].find(
-                {"_id": {"$in": temp_project_ids}}, {"_id": 1}
-            )
-        )
+        # Check which projects are not cached yet
+        new_ids = check_new_project_ids(temp_project_ids)
 
         # If we found any existing project, stop searching
-        if existing_projects:
-            new_ids = [pid for pid in temp_project_ids if pid not in existing_projects]
+        if len(new_ids) < len(temp_project_ids):
             new_project_ids.extend(new_ids)
+            completed = True
             break
 
         # If all projects are new, add them and continue searching
@@ -221,5 +386,107 @@ def check_newest_search_result() -> List[str]:
         log.debug(f"Found {len(temp_project_ids)} new project IDs at offset {offset}")
 
         offset += limit
+    else:
+        log.warning(
+            f"Search window of {SEARCH_WINDOW_SIZE} results exhausted, some new projects may be missed"
+        )
+
+    if cursor is not None:
+        # 游标之前也可能有已缓存的 project，统一过滤一次
+        new_project_ids = check_new_project_ids(new_project_ids)
+
+    if completed and newest is not None:
+        set_modrinth_newest_cursor(*newest)
+    elif not completed:
+        log.warning("Newest search walk incomplete, keep the previous cursor")
 
     return new_project_ids
+
+
+def _parse_date(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+def _filter_unsynced_projects(
+    projects_date: Dict[str, datetime.datetime]
+) -> List[str]:
+    """
+    返回本地 updated 与搜索结果中 date_modified 不一致的 project_id
+    """
+    local_updated = {
+        project["_id"]: project.get("updated")
+        for project in raw_mongo_client["modrinth_projects"].find(
+            {"_id": {"$in": list(projects_date.keys())}}, {"updated": 1}
+        )
+    }
+    unsynced_project_ids = []
+    for project_id, date_modified in projects_date.items():
+        updated = parse_datetime(local_updated.get(project_id))
+        if updated is None or int(updated.timestamp()) != int(
+            date_modified.timestamp()
+        ):
+            unsynced_project_ids.append(project_id)
+    return unsynced_project_ids
+
+
+def check_updated_search_result(
+    watermark: datetime.datetime,
+) -> Tuple[List[str], Optional[datetime.datetime]]:
+    """
+    遍历 updated search result 直到 date_modified 早于 watermark 减去延迟余量
+
+    搜索索引可能晚于实际更新，余量内的 project 与本地 updated 对比，不一致的才同步
+
+    返回期间更新过的 project_id；只有完整遍历到水位线时才返回见到的最新 date_modified，
+    请求失败或者超出搜索窗口时返回 None，由调用方保留旧水位线
+    """
+    threshold = watermark - datetime.timedelta(seconds=UPDATED_SEARCH_LAG_MARGIN)
+    updated_project_ids = []
+    lagged_projects: Dict[str, datetime.datetime] = {}
+    newest_date: Optional[datetime.datetime] = None
+    completed = False
+    offset = 0
+    limit = 100
+
+    while offset + limit <= SEARCH_WINDOW_SIZE:
+        res = fetch_search_result(offset=offset, index="updated", limit=limit)
+        if res is None:
+            log.warning(f"Failed to fetch updated search result at offset {offset}")
+            break
+        if not res["hits"]:
+            completed = True
+            break
+
+        reached_watermark = False
+        for project in res["hits"]:
+            date_modified = _parse_date(project["date_modified"])
+            if newest_date is None or date_modified > newest_date:
+                newest_date = date_modified
+            if date_modified > watermark:
+                updated_project_ids.append(project["project_id"])
+            elif date_modified > threshold:
+                lagged_projects[project["project_id"]] = date_modified
+            else:
+                reached_watermark = True
+
+        # 整页检查完再停止，避免同一页内排序不严格时漏掉
+        if reached_watermark:
+            completed = True
+            break
+
+        offset += limit
+    else:
+        log.warning(
+            f"Search window exhausted before reaching watermark {watermark.isoformat()}"
+        )
+
+    if lagged_projects:
+        updated_project_ids.extend(_filter_unsynced_projects(lagged_projects))
+
+    log.debug(
+        f"Found {len(updated_project_ids)} updated project IDs since {watermark.isoformat()}"
+    )
+    if not completed:
+        log.warning("Updated search walk incomplete, keep the previous watermark")
+        return updated_project_ids, None
+    return updated_project_ids, newest_date
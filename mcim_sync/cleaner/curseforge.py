@@ -0,0 +1,106 @@
+from typing import Dict, List, Optional, Tuple
+
+from mcim_sync.database.mongodb import raw_mongo_client
+from mcim_sync.apis.curseforge import get_mod
+from mcim_sync.exceptions import ResponseCodeException
+from mcim_sync.tasks import iter_tasks_concurrently
+from mcim_sync.utils.loger import log
+from mcim_sync.utils.known_ids import curseforge_known_modids
+from mcim_sync.config import Config
+
+config = Config.load()
+
+MAX_WORKERS: int = config.max_workers
+# 每次最多逐个确认的 modid 数量，剩下的留到下次刷新
+DEAD_CHECK_LIMIT: int = config.curseforge_dead_check_limit
+
+# 每批删除的 mod 数量
+REMOVE_BATCH_SIZE = 1000
+
+
+def _check_mod_dead(modId: int) -> Tuple[int, Optional[bool]]:
+    """
+    单独请求 get_mod，404 视为已删除；其他错误无法确定，返回 None
+    """
+    try:
+        get_mod(modId)
+        return modId, False
+    except ResponseCodeException as e:
+        if e.status_code == 404:
+            return modId, True
+        log.warning(f"Failed to confirm mod {modId}: {e}")
+        return modId, None
+    except Exception as e:
+        log.warning(f"Failed to confirm mod {modId}: {e}")
+        return modId, None
+
+
+def confirm_dead_modids(modids: List[int]) -> List[int]:
+    """
+    批量接口没有返回的 mod 不一定已经删除，逐个请求确认，请求频率由域名限速控制
+    """
+    modids = list(set(modids))
+    if len(modids) > DEAD_CHECK_LIMIT:
+        log.info(
+            f"{len(modids)} missing mods exceed dead check limit, only checking {DEAD_CHECK_LIMIT}"
+        )
+        modids = modids[:DEAD_CHECK_LIMIT]
+
+    dead_modids = []
+    for modId, dead in iter_tasks_concurrently(
+        modids, _check_mod_dead, MAX_WORKERS, "confirm_curseforge_dead"
+    ):
+        if dead:
+            dead_modids.append(modId)
+    log.debug(f"Confirmed {len(dead_modids)} of {len(modids)} missing mods are dead")
+    return dead_modids
+
+
+def _count_files_by_modid(modids: List[int]) -> Dict[int, int]:
+    result = raw_mongo_client["curseforge_files"].aggregate(
+        [
+            {"$match": {"modId": {"$in": modids}}},
+            {"$group": {"_id": "$modId", "count": {"$sum": 1}}},
+        ]
+    )
+    return {doc["_id"]: doc["count"] for doc in result}
+
+
+def remove_mods(modids: List[int]):
+    """
+    按批用 $in 删除 mod 及其所有 curseforge_files，包括 isAvailable 为 False 的文件
+
+    返回每个 mod 删除的文件数量
+    """
+    result = []
+    for i in range(0, len(modids), REMOVE_BATCH_SIZE):
+        chunk = modids[i : i + REMOVE_BATCH_SIZE]
+
+        existing_modids = set(
+            mod["_id"]
+            for mod in raw_mongo_client["curseforge_mods"].find(
+                {"_id": {"$in": chunk}}, {"_id": 1}
+            )
+        )
+        file_counts = _count_files_by_modid(chunk)
+
+        mod_result = raw_mongo_client["curseforge_mods"].delete_many(
+            {"_id": {"$in": chunk}}
+        )
+        file_result = raw_mongo_client["curseforge_files"].delete_many(
+            {"modId": {"$in": chunk}}
+        )
+        curseforge_known_modids.discard(chunk)
+        log.debug(
+            f"Removed {mod_result.deleted_count} mods, {file_result.deleted_count} files"
+        )
+
+        for modId in chunk:
+            if modId not in existing_modids and modId not in file_counts:
+                log.debug(f"Can't remove mod {modId}, not found")
+                continue
+            result.append(
+                {"modId": modId, "file_count": file_counts.get(modId, 0)}
+            )
+            log.debug(f"Remove mod {modId}, {file_counts.get(modId, 0)} files")
+    return result
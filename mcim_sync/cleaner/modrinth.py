@@ -1,29 +1,79 @@
-from typing import List
+from typing import Dict, List
 
 from mcim_sync.database.mongodb import raw_mongo_client
 from mcim_sync.utils.loger import log
+from mcim_sync.utils.known_ids import modrinth_known_project_ids
 from mcim_sync.config import Config
 
 config = Config.load()
 
+# 每批删除的 project 数量
+REMOVE_BATCH_SIZE = 1000
+
+
+def _count_by_project_id(collection: str, project_ids: List[str]) -> Dict[str, int]:
+    result = raw_mongo_client[collection].aggregate(
+        [
+            {"$match": {"project_id": {"$in": project_ids}}},
+            {"$group": {"_id": "$project_id", "count": {"$sum": 1}}},
+        ]
+    )
+    return {doc["_id"]: doc["count"] for doc in result}
+
+
 def remove_project(project_id: str):
-    project_result = raw_mongo_client["modrinth_projects"].delete_one({"_id": project_id})
-    version_result = raw_mongo_client["modrinth_versions"].delete_many({"project_id": project_id})
-    hash_result = raw_mongo_client["modrinth_hashes"].delete_many({"project_id": project_id})
-    log.debug(f"Remove project {project_id}, {version_result.deleted_count} versions, {hash_result.deleted_count} hashes")
-    return project_result, version_result, hash_result
+    return remove_projects([project_id])
+
 
 def remove_projects(project_ids: List[str]):
+    """
+    按批用 $in 删除 project 及其 modrinth_versions、modrinth_files
+
+    删除前按 project_id 聚合统计版本数和文件数，返回每个 project 的删除数量
+    """
     result = []
-    for project_id in project_ids:
-        singal_result = remove_project(project_id)
-        if singal_result[0].deleted_count == 0 and singal_result[1].deleted_count == 0 and singal_result[2].deleted_count == 0:
-            log.debug(f"Can't remove project {project_id}, not found")
-            continue
-        result.append({
-            "project_id": project_id,
-            "version_count": singal_result[1].deleted_count,
-            "hash_count": singal_result[2].deleted_count
-        })
-        log.debug(f"Remove project {project_id}, {singal_result[1].deleted_count} versions, {singal_result[2].deleted_count} hashes")
-    return result
\ No newline at end of file
+    for i in range(0, len(project_ids), REMOVE_BATCH_SIZE):
+        chunk = project_ids[i : i + REMOVE_BATCH_SIZE]
+
+        existing_project_ids = set(
+            project["_id"]
+            for project in raw_mongo_client["modrinth_projects"].find(
+                {"_id": {"$in": chunk}}, {"_id": 1}
+            )
+        )
+        version_counts = _count_by_project_id("modrinth_versions", chunk)
+        file_counts = _count_by_project_id("modrinth_files", chunk)
+
+        project_result = raw_mongo_client["modrinth_projects"].delete_many(
+            {"_id": {"$in": chunk}}
+        )
+        version_result = raw_mongo_client["modrinth_versions"].delete_many(
+            {"project_id": {"$in": chunk}}
+        )
+        file_result = raw_mongo_client["modrinth_files"].delete_many(
+            {"project_id": {"$in": chunk}}
+        )
+        modrinth_known_project_ids.discard(chunk)
+        log.debug(
+            f"Removed {project_result.deleted_count} projects, {version_result.deleted_count} versions, {file_result.deleted_count} files"
+        )
+
+        for project_id in chunk:
+            if (
+                project_id not in existing_project_ids
+                and project_id not in version_counts
+                and project_id not in file_counts
+            ):
+                log.debug(f"Can't remove project {project_id}, not found")
+                continue
+            result.append(
+                {
+                    "project_id": project_id,
+                    "version_count": version_counts.get(project_id, 0),
+                    "file_count": file_counts.get(project_id, 0),
+                }
+            )
+            log.debug(
+                f"Remove project {project_id}, {version_counts.get(project_id, 0)} versions, {file_counts.get(project_id, 0)} files"
+            )
+    return result
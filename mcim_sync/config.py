@@ -24,8 +24,10 @@ class RedisConfigModel(BaseModel):
 
 class JobConfigModel(BaseModel):
     curseforge_refresh: bool = True
+    curseforge_refresh_incremental: bool = True
     curseforge_refresh_full: bool = False
     modrinth_refresh: bool = True
+    modrinth_refresh_incremental: bool = True
     modrinth_refresh_full: bool = False
     sync_curseforge_by_queue: bool = True
     sync_curseforge_by_search: bool = True
@@ -34,6 +36,8 @@ class JobConfigModel(BaseModel):
     curseforge_categories: bool = True
     modrinth_tags: bool = True
     global_statistics: bool = True
+    # 常驻消费队列，启用后不再注册定时的队列任务
+    queue_consumer: bool = False
 
     @field_validator('*', mode='before')
     def validate_bool(cls, v):
@@ -43,8 +47,10 @@ class JobConfigModel(BaseModel):
 
 
 class JobInterval(BaseModel):
-    curseforge_refresh: int = 60 * 60 * 2  # 2 hours
-    modrinth_refresh: int = 60 * 60 * 2  # 2 hours
+    curseforge_refresh: int = 60 * 60 * 24  # 24 hours
+    curseforge_refresh_incremental: int = 60 * 60 * 2  # 2 hours
+    modrinth_refresh: int = 60 * 60 * 24  # 24 hours
+    modrinth_refresh_incremental: int = 60 * 60 * 2  # 2 hours
     curseforge_refresh_full: int = 60 * 60 * 48  # 48 hours
     modrinth_refresh_full: int = 60 * 60 * 48  # 48 hours
     sync_curseforge_by_queue: int = 60 * 5  # 5 minutes
@@ -56,8 +62,10 @@ class JobInterval(BaseModel):
     global_statistics: int = 60 * 60 * 24  # 24 hours
 
 class CronTrigger(BaseModel):
-    curseforge_refresh: str = "0 */2 * * *"  # Every 2 hours
-    modrinth_refresh: str = "0 */2 * * *"  # Every 2 hours
+    curseforge_refresh: str = "0 1 * * *"  # Every day at 01:00
+    curseforge_refresh_incremental: str = "0 */2 * * *"  # Every 2 hours
+    modrinth_refresh: str = "0 3 * * *"  # Every day at 03:00
+    modrinth_refresh_incremental: str = "0 */2 * * *"  # Every 2 hours
     curseforge_refresh_full: str = "0 2 * * *"  # Every day at 02:00
     modrinth_refresh_full: str = "0 4 * * *" # Every day at 04:00
     sync_curseforge_by_queue: str = "*/20 * * * *"  # Every 20 minutes
@@ -88,11 +96,54 @@ class ConfigModel(BaseModel):
     cron_trigger: CronTrigger = CronTrigger()
     
     max_workers: int = 8
+    check_workers: int = 4  # 并发检查更新的块数，实际频率由域名限速控制
     curseforge_chunk_size: int = 1000
     modrinth_chunk_size: int = 100
     curseforge_delay: Union[float, int] = 1
     modrinth_delay: Union[float, int] = 1
 
+    # 刷新任务使用流水线，检查出的过期数据立即同步，不等待全库检查结束
+    refresh_pipeline: bool = True
+    pipeline_queue_size: int = 4
+
+    # 队列每批取出的数量，以及每次任务最多处理的批数
+    queue_batch_size: int = 1000
+    queue_max_batches: int = 10
+    # 队列同步失败后重试的初始间隔、最大间隔（秒）以及最大重试次数
+    queue_retry_base_delay: int = 60 * 5
+    queue_retry_max_delay: int = 60 * 60 * 24
+    queue_retry_max_attempts: int = 6
+    # 上游确认不存在的 id 的负缓存有效期以及分桶间隔（秒）
+    negative_cache_ttl: int = 60 * 60 * 6
+    negative_cache_bucket: int = 60 * 60
+    # 常驻队列消费者合并一批的等待时间，以及收不到通知时的轮询间隔（秒）
+    queue_consumer_linger: float = 2
+    queue_consumer_poll_interval: float = 30
+    # 订阅键空间通知立即处理新成员，会用 CONFIG SET 修改与 API 前端共用的 Redis，
+    # 关闭时只按轮询间隔处理
+    queue_consumer_keyspace_events: bool = False
+
+    # 增量刷新时搜索索引可能晚于实际更新，水位线之前这段时间（秒）内的结果与本地对比后再同步
+    updated_search_lag_margin: int = 60 * 30
+
+    # 已缓存 id 的内存索引，补齐其他进程写入的间隔（秒）以及可选的快照目录
+    known_ids_refresh_interval: int = 60 * 10
+    known_ids_snapshot_dir: Optional[str] = None
+
+    # CurseForge 同步时只拉取新增的文件，完整文件列表留给每日检查和 sync_curseforge_full
+    curseforge_incremental_files: bool = True
+    # 每次刷新最多逐个确认是否已删除的 CurseForge Mod 数量
+    curseforge_dead_check_limit: int = 1000
+    # 完整文件列表分页大小以及并发拉取的页数
+    curseforge_files_page_size: int = 1000
+    curseforge_files_page_workers: int = 4
+    # Modrinth 同步时只拉取新增的版本，完整版本列表留给每日检查和 refresh_modrinth_full
+    modrinth_incremental_versions: bool = True
+    # 每日按修改时间检查时，过期的 Mod / Project 拉取完整文件和版本列表，纠正已有数据的变化
+    modify_date_refresh_full: bool = True
+    # 队列和搜索同步新 Project 时跨 Project 批量拉取版本
+    modrinth_batch_versions: bool = True
+
     # API 配置
     curseforge_api_key: str = "<api key>"
     curseforge_api: str = "https://api.curseforge.com"  # 不然和api的拼接对不上
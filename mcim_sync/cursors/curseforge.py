@@ -0,0 +1,60 @@
+from typing import Optional, Tuple
+import datetime
+
+from mcim_sync.database._redis import sync_redis_engine
+from mcim_sync.config import Config
+
+config = Config.load()
+
+
+def _updated_watermark_key(gameId: int, classId: int) -> str:
+    return f"curseforge_updated_watermark:{gameId}:{classId}"
+
+
+def get_curseforge_updated_watermark(
+    gameId: int, classId: int
+) -> Optional[datetime.datetime]:
+    """
+    上次增量刷新处理到的 dateModified（UTC，无时区）
+    """
+    watermark: Optional[bytes] = sync_redis_engine.get(
+        _updated_watermark_key(gameId, classId)
+    )
+    if watermark is None:
+        return None
+    return datetime.datetime.fromisoformat(watermark.decode("utf-8"))
+
+
+def set_curseforge_updated_watermark(
+    gameId: int, classId: int, watermark: datetime.datetime
+):
+    sync_redis_engine.set(
+        _updated_watermark_key(gameId, classId), watermark.isoformat()
+    )
+
+
+def _newest_cursor_key(gameId: int, classId: int) -> str:
+    return f"curseforge_newest_cursor:{gameId}:{classId}"
+
+
+def get_curseforge_newest_cursor(
+    gameId: int, classId: int
+) -> Optional[Tuple[int, datetime.datetime]]:
+    """
+    上次新 Mod 搜索见到的最新 (modid, dateReleased)
+    """
+    cursor: dict = sync_redis_engine.hgetall(_newest_cursor_key(gameId, classId))
+    if not cursor:
+        return None
+    return int(cursor[b"id"]), datetime.datetime.fromisoformat(
+        cursor[b"date"].decode("utf-8")
+    )
+
+
+def set_curseforge_newest_cursor(
+    gameId: int, classId: int, modid: int, date: datetime.datetime
+):
+    sync_redis_engine.hset(
+        _newest_cursor_key(gameId, classId),
+        mapping={"id": modid, "date": date.isoformat()},
+    )
@@ -0,0 +1,42 @@
+from typing import Optional, Tuple
+import datetime
+
+from mcim_sync.database._redis import sync_redis_engine
+from mcim_sync.config import Config
+
+config = Config.load()
+
+UPDATED_WATERMARK_KEY = "modrinth_updated_watermark"
+NEWEST_CURSOR_KEY = "modrinth_newest_cursor"
+
+
+def get_modrinth_updated_watermark() -> Optional[datetime.datetime]:
+    """
+    上次增量刷新处理到的 date_modified（UTC，无时区）
+    """
+    watermark: Optional[bytes] = sync_redis_engine.get(UPDATED_WATERMARK_KEY)
+    if watermark is None:
+        return None
+    return datetime.datetime.fromisoformat(watermark.decode("utf-8"))
+
+
+def set_modrinth_updated_watermark(watermark: datetime.datetime):
+    sync_redis_engine.set(UPDATED_WATERMARK_KEY, watermark.isoformat())
+
+
+def get_modrinth_newest_cursor() -> Optional[Tuple[str, datetime.datetime]]:
+    """
+    上次新 Project 搜索见到的最新 (project_id, date_created)
+    """
+    cursor: dict = sync_redis_engine.hgetall(NEWEST_CURSOR_KEY)
+    if not cursor:
+        return None
+    return cursor[b"id"].decode("utf-8"), datetime.datetime.fromisoformat(
+        cursor[b"date"].decode("utf-8")
+    )
+
+
+def set_modrinth_newest_cursor(project_id: str, date: datetime.datetime):
+    sync_redis_engine.hset(
+        NEWEST_CURSOR_KEY, mapping={"id": project_id, "date": date.isoformat()}
+    )
@@ -1,11 +1,43 @@
+import datetime
 from odmantic import SyncEngine
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING
 from pymongo.database import Database
 from pymongo import errors as pymongo_errors
 from mcim_sync.config import Config
+from mcim_sync.utils.loger import log
 
 _mongodb_config = Config.load().mongodb
 
+# 同步任务查询依赖的索引，启动时确保存在
+MONGODB_INDEXES = {
+    "curseforge_mods": [
+        [("sync_at", ASCENDING), ("_id", ASCENDING)],
+    ],
+    "modrinth_projects": [
+        [("sync_at", ASCENDING), ("_id", ASCENDING)],
+    ],
+    # 删除过期文件时按 modId / project_id 覆盖查询已有的 id
+    "curseforge_files": [
+        [("modId", ASCENDING), ("isAvailable", ASCENDING), ("_id", ASCENDING)],
+        # 队列中的指纹先在本地解析
+        [("fileFingerprint", ASCENDING), ("modId", ASCENDING)],
+    ],
+    "modrinth_versions": [
+        [("project_id", ASCENDING), ("_id", ASCENDING)],
+    ],
+    "modrinth_files": [
+        [("project_id", ASCENDING), ("version_id", ASCENDING)],
+        # 队列中的 hash 先在本地解析，_id 上的索引只能匹配整个 hashes 文档
+        [("_id.sha1", ASCENDING), ("project_id", ASCENDING)],
+        [("_id.sha512", ASCENDING), ("project_id", ASCENDING)],
+    ],
+}
+
+# 旧版本可能以字符串写入 sync_at，需要迁移为 BSON date 才能走索引
+SYNC_AT_COLLECTIONS = ["curseforge_mods", "modrinth_projects"]
+# 缺失或无法解析的 sync_at 迁移为最早的时间，下次刷新优先检查
+LEGACY_SYNC_AT = datetime.datetime(1970, 1, 1)
+
 def ping_mongodb_client(client: MongoClient) -> bool:
     try:
         client.admin.command('ping')
@@ -53,5 +85,44 @@ def init_mongodb_raw_client() -> Database:
     return raw_mongo_client[_mongodb_config.database]
 
 
+def init_mongodb_indexes():
+    for collection, indexes in MONGODB_INDEXES.items():
+        for keys in indexes:
+            name = raw_mongo_client[collection].create_index(keys)
+            log.debug(f"Ensured index {name} on {collection}")
+
+
+def migrate_legacy_sync_at():
+    """
+    把字符串类型的 sync_at 转为 BSON date，缺失的 sync_at 视为从未同步
+    """
+    for collection in SYNC_AT_COLLECTIONS:
+        converted = raw_mongo_client[collection].update_many(
+            {"sync_at": {"$type": "string"}},
+            [
+                {
+                    "$set": {
+                        "sync_at": {
+                            "$dateFromString": {
+                                "dateString": "$sync_at",
+                                # 无法解析的旧值视为从未同步，不让启动失败
+                                "onError": LEGACY_SYNC_AT,
+                                "onNull": LEGACY_SYNC_AT,
+                            }
+                        }
+                    }
+                }
+            ],
+        )
+        missing = raw_mongo_client[collection].update_many(
+            {"sync_at": {"$exists": False}},
+            {"$set": {"sync_at": LEGACY_SYNC_AT}},
+        )
+        if converted.modified_count or missing.modified_count:
+            log.info(
+                f"Migrated sync_at in {collection}: {converted.modified_count} converted from string, {missing.modified_count} filled"
+            )
+
+
 sync_mongo_engine: SyncEngine = init_mongodb_syncengine()
 raw_mongo_client: Database = init_mongodb_raw_client()
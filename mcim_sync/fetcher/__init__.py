@@ -0,0 +1,87 @@
+from typing import Any, Iterator, List, Optional
+import datetime
+
+from pymongo.collection import Collection
+
+
+def iter_documents_by_id(
+    collection: Collection,
+    chunk_size: int,
+    query_filter: Optional[dict] = None,
+    projection: Optional[dict] = None,
+) -> Iterator[List[dict]]:
+    """
+    按 _id 升序键集分页遍历集合，每次产出一页文档
+
+    下一页从上一页最后一个 _id 之后开始，不使用 skip，后面的页和第一页开销相同，
+    并发写入时也不会重复或漏掉已存在的文档
+    """
+    last_id: Any = None
+    while True:
+        if last_id is None:
+            query = query_filter or {}
+        elif query_filter:
+            query = {"$and": [query_filter, {"_id": {"$gt": last_id}}]}
+        else:
+            query = {"_id": {"$gt": last_id}}
+
+        documents = list(
+            collection.find(query, projection)
+            .sort("_id", 1)
+            .limit(chunk_size)
+        )
+        if not documents:
+            break
+
+        yield documents
+
+        if len(documents) < chunk_size:
+            break
+        last_id = documents[-1]["_id"]
+
+
+def iter_documents_by_sync_at(
+    collection: Collection,
+    chunk_size: int,
+    before: datetime.datetime,
+    projection: Optional[dict] = None,
+) -> Iterator[List[dict]]:
+    """
+    按 sync_at 升序（最久未同步的优先）遍历 sync_at 早于 before 的文档
+
+    以 (sync_at, _id) 作为键集分页，依赖 sync_at_1__id_1 索引
+    """
+    if projection is not None:
+        projection = {**projection, "sync_at": 1}
+
+    last: Optional[tuple] = None
+    while True:
+        query: dict = {"sync_at": {"$lt": before}}
+        if last is not None:
+            last_sync_at, last_id = last
+            query = {
+                "$and": [
+                    query,
+                    {
+                        "$or": [
+                            {"sync_at": {"$gt": last_sync_at}},
+                            {"sync_at": last_sync_at, "_id": {"$gt": last_id}},
+                        ]
+                    },
+                ]
+            }
+
+        documents = list(
+            collection.find(query, projection)
+            .sort([("sync_at", 1), ("_id", 1)])
+            .limit(chunk_size)
+        )
+        if not documents:
+            break
+
+        yield documents
+
+        if len(documents) < chunk_size:
+            break
+        last = (documents[-1]["sync_at"], documents[-1]["_id"])
+
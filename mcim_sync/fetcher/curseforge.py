@@ -1,52 +1,87 @@
-from typing import Union, List
-import time
+from typing import Union, List, Dict, Optional, Iterator, Set, Tuple
+import datetime
 
-from mcim_sync.database.mongodb import sync_mongo_engine
+from mcim_sync.database.mongodb import raw_mongo_client
 from mcim_sync.utils.loger import log
 from mcim_sync.config import Config
 from mcim_sync.models.database.curseforge import Mod
-from mcim_sync.checker.curseforge import check_curseforge_data_updated
+from mcim_sync.checker.curseforge import (
+    check_curseforge_data_updated,
+    CURSEFORGE_CHECK_PROJECTION,
+)
+from mcim_sync.fetcher import (
+    iter_documents_by_id,
+    iter_documents_by_sync_at,
+)
+from mcim_sync.tasks import iter_tasks_concurrently
 
 config = Config.load()
 
 CURSEFORGE_LIMIT_SIZE: int = config.curseforge_chunk_size
 MODRINTH_LIMIT_SIZE: int = config.modrinth_chunk_size
 MAX_WORKERS: int = config.max_workers
+CHECK_WORKERS: int = config.check_workers
 CURSEFORGE_DELAY: Union[float, int] = config.curseforge_delay
 MODRINTH_DELAY: Union[float, int] = config.modrinth_delay
 
 
 def fetch_all_curseforge_data() -> List[int]:
-    skip = 0
     result = []
-    while True:
-        mods_result: List[Mod] = list(
-            sync_mongo_engine.find(Mod, skip=skip, limit=CURSEFORGE_LIMIT_SIZE)
-        )
-
-        if not mods_result:
-            break
-        skip += CURSEFORGE_LIMIT_SIZE
-        result.extend([mod.id for mod in mods_result])
+    for mods_result in iter_documents_by_id(
+        raw_mongo_client[Mod.__collection__],
+        CURSEFORGE_LIMIT_SIZE,
+        projection={"_id": 1},
+    ):
+        result.extend([mod["_id"] for mod in mods_result])
         # time.sleep(CURSEFORGE_DELAY)
         # log.debug(f"Delay {CURSEFORGE_DELAY} seconds")
     return result
 
 
-def fetch_expired_curseforge_data() -> List[int]:
-    expired_modids = set()
-    skip = 0
-    while True:
-        mods_result: List[Mod] = list(
-            sync_mongo_engine.find(Mod, skip=skip, limit=CURSEFORGE_LIMIT_SIZE)
-        )
-
-        if not mods_result:
-            break
-        skip += CURSEFORGE_LIMIT_SIZE
-        check_expired_result = check_curseforge_data_updated(mods_result)
-        expired_modids.update(check_expired_result)
-        log.debug(f"Matched {len(check_expired_result)} expired mods")
-        time.sleep(CURSEFORGE_DELAY)
-        log.debug(f"Delay {CURSEFORGE_DELAY} seconds")
-    return list(expired_modids)
+def iter_curseforge_data_by_sync_at(
+    before: Optional[datetime.datetime] = None,
+    projection: Optional[dict] = None,
+) -> Iterator[List[dict]]:
+    """
+    按 sync_at 升序产出 sync_at 早于 before（默认当前时间）的 Mod 文档，最久未同步的在前
+    """
+    if before is None:
+        before = datetime.datetime.utcnow()
+    return iter_documents_by_sync_at(
+        raw_mongo_client[Mod.__collection__],
+        CURSEFORGE_LIMIT_SIZE,
+        before=before,
+        projection=projection or {"_id": 1},
+    )
+
+
+def iter_curseforge_check_chunks() -> Iterator[List[dict]]:
+    # 最久未同步的先检查；遍历期间同步过的 sync_at 晚于开始时间，不会重复检查
+    return iter_curseforge_data_by_sync_at(projection=CURSEFORGE_CHECK_PROJECTION)
+
+
+def check_expired_curseforge_chunk(
+    mods: List[dict],
+) -> Tuple[Dict[int, dict], Set[int]]:
+    check_expired_result, missing_result = check_curseforge_data_updated(mods)
+    log.debug(
+        f"Matched {len(check_expired_result)} expired mods, {len(missing_result)} missing mods"
+    )
+    return check_expired_result, missing_result
+
+
+def fetch_expired_curseforge_data() -> Tuple[Dict[int, dict], List[int]]:
+    """
+    返回过期的 modid 及其 Mod 信息，以及批量接口没有返回的 modid
+    """
+    expired_mods: Dict[int, dict] = {}
+    missing_modids = set()
+    for check_expired_result, missing_result in iter_tasks_concurrently(
+        iter_curseforge_check_chunks(),
+        check_expired_curseforge_chunk,
+        CHECK_WORKERS,
+        "check_curseforge",
+    ):
+        expired_mods.update(check_expired_result)
+        missing_modids.update(missing_result)
+    return expired_mods, list(missing_modids)
@@ -1,18 +1,26 @@
-from typing import Union, List
+from typing import Union, List, Dict, Optional, Iterator, Set, Tuple
 import datetime
-import time
 
-from mcim_sync.database.mongodb import sync_mongo_engine
+from mcim_sync.database.mongodb import raw_mongo_client
 from mcim_sync.utils.loger import log
 from mcim_sync.config import Config
 from mcim_sync.models.database.modrinth import Project
-from mcim_sync.checker.modrinth import check_modrinth_data_updated_and_alive
+from mcim_sync.checker.modrinth import (
+    check_modrinth_data_updated_and_alive,
+    MODRINTH_CHECK_PROJECTION,
+)
+from mcim_sync.fetcher import (
+    iter_documents_by_id,
+    iter_documents_by_sync_at,
+)
+from mcim_sync.tasks import iter_tasks_concurrently
 
 config = Config.load()
 
 
 MODRINTH_LIMIT_SIZE: int = config.modrinth_chunk_size
 MAX_WORKERS: int = config.max_workers
+CHECK_WORKERS: int = config.check_workers
 
 MODRINTH_DELAY: Union[float, int] = config.modrinth_delay
 
@@ -20,16 +28,13 @@ MODRINTH_DELAY: Union[float, int] = config.modrinth_delay
 
 
 def fetch_all_modrinth_data() -> List[str]:
-    skip = 0
     result = []
-    while True:
-        projects_result: List[Project] = list(
-            sync_mongo_engine.find(Project, skip=skip, limit=MODRINTH_LIMIT_SIZE)
-        )
-        if not projects_result:
-            break
-        skip += MODRINTH_LIMIT_SIZE
-        result.extend([project.id for project in projects_result])
+    for projects_result in iter_documents_by_id(
+        raw_mongo_client[Project.__collection__],
+        MODRINTH_LIMIT_SIZE,
+        projection={"_id": 1},
+    ):
+        result.extend([project["_id"] for project in projects_result])
         # time.sleep(MODRINTH_DELAY)
         # log.debug(f"Delay {MODRINTH_DELAY} seconds")
     return result
@@ -38,57 +43,52 @@ def fetch_all_modrinth_data() -> List[str]:
 # fetch by sync_date
 
 
-def fetch_modrinth_data_by_sync_at():
-    skip = 0
-    result = []
-    while True:
-        query = {
-            "$expr": {
-                "$lt": [
-                    {"$dateFromString": {"dateString": "$sync_at"}},
-                    datetime.datetime.now() - datetime.timedelta(days=1),
-                ]
-            }
-        }
-        projects_result: List[Project] = list(
-            sync_mongo_engine.find(
-                Project,
-                # skip=skip, limit=MODRINTH_LIMIT_SIZE
-                query,
-                skip=skip,
-                limit=MODRINTH_LIMIT_SIZE,
-            )
-        )
-        if not projects_result:
-            break
-        skip += MODRINTH_LIMIT_SIZE
-        result.extend([project.id for project in projects_result])
-        # time.sleep(MODRINTH_DELAY)
-        # log.debug(f"Delay {MODRINTH_DELAY} seconds")
-    return result
-
-
-
-def fetch_expired_and_removed_modrinth_data() -> tuple[List[str], List[str]]:
-    expired_project_ids = set()
+def iter_modrinth_data_by_sync_at(
+    before: Optional[datetime.datetime] = None,
+    projection: Optional[dict] = None,
+) -> Iterator[List[dict]]:
+    """
+    按 sync_at 升序产出 sync_at 早于 before（默认当前时间）的 Project 文档，最久未同步的在前
+    """
+    if before is None:
+        before = datetime.datetime.utcnow()
+    return iter_documents_by_sync_at(
+        raw_mongo_client[Project.__collection__],
+        MODRINTH_LIMIT_SIZE,
+        before=before,
+        projection=projection or {"_id": 1},
+    )
+
+
+def iter_modrinth_check_chunks() -> Iterator[List[dict]]:
+    # 最久未同步的先检查；遍历期间同步过的 sync_at 晚于开始时间，不会重复检查
+    return iter_modrinth_data_by_sync_at(projection=MODRINTH_CHECK_PROJECTION)
+
+
+def check_expired_and_removed_modrinth_chunk(
+    projects: List[dict],
+) -> Tuple[Dict[str, dict], Set[str]]:
+    check_expired_result, not_alive_result = check_modrinth_data_updated_and_alive(
+        projects
+    )
+    log.debug(f"Matched {len(check_expired_result)} expired projects, {len(not_alive_result)} removed projects")
+    if len(not_alive_result) != 0:
+        log.debug(f"Removed project ids: {not_alive_result}")
+    return check_expired_result, not_alive_result
+
+
+def fetch_expired_and_removed_modrinth_data() -> Tuple[Dict[str, dict], List[str]]:
+    """
+    返回过期的 project_id 及其 Project 信息，以及源已删除的 project_id
+    """
+    expired_projects: Dict[str, dict] = {}
     removed_project_ids = set()
-    skip = 0
-    while True:
-        projects_result: List[Project] = list(
-            sync_mongo_engine.find(Project, skip=skip, limit=MODRINTH_LIMIT_SIZE)
-        )
-        if not projects_result:
-            break
-        skip += MODRINTH_LIMIT_SIZE
-        result = check_modrinth_data_updated_and_alive(projects_result)
-        if result is None:
-            continue
-        check_expired_result, not_alive_result = result
-        expired_project_ids.update(check_expired_result)
+    for check_expired_result, not_alive_result in iter_tasks_concurrently(
+        iter_modrinth_check_chunks(),
+        check_expired_and_removed_modrinth_chunk,
+        CHECK_WORKERS,
+        "check_modrinth",
+    ):
+        expired_projects.update(check_expired_result)
         removed_project_ids.update(not_alive_result)
-        log.debug(f"Matched {len(check_expired_result)} expired projects, {len(not_alive_result)} removed projects")
-        if len(not_alive_result) != 0:
-            log.debug(f"Removed project ids: {not_alive_result}")
-        time.sleep(MODRINTH_DELAY)
-        log.debug(f"Delay {MODRINTH_DELAY} seconds")
-    return list(expired_project_ids), list(removed_project_ids)
+    return expired_projects, list(removed_project_ids)
@@ -0,0 +1,161 @@
+from typing import Any, Iterable, List
+import time
+
+from mcim_sync.database._redis import sync_redis_engine
+from mcim_sync.utils.loger import log
+from mcim_sync.config import Config
+
+config = Config.load()
+
+QUEUE_BATCH_SIZE: int = config.queue_batch_size
+QUEUE_RETRY_BASE_DELAY: int = config.queue_retry_base_delay
+QUEUE_RETRY_MAX_DELAY: int = config.queue_retry_max_delay
+QUEUE_RETRY_MAX_ATTEMPTS: int = config.queue_retry_max_attempts
+
+# 取出但尚未确认处理完成的成员暂存在 {key}:processing
+PROCESSING_SUFFIX = ":processing"
+# 同步失败等待重试的成员，score 为下次重试的时间戳
+RETRY_SUFFIX = ":retry"
+# 每个成员连续失败的次数
+ATTEMPTS_SUFFIX = ":attempts"
+# 超过最大重试次数的成员，不再自动重试
+DEAD_SUFFIX = ":dead"
+
+# 上次未确认的成员优先重新取出；否则 SPOP 一批并原子地移入 processing 集合，
+# 取出期间 API 前端新加入的成员留在原集合中，不会被删除
+_CLAIM_SCRIPT = """
+local pending = redis.call('SMEMBERS', KEYS[2])
+if #pending > 0 then
+    return pending
+end
+local members = redis.call('SPOP', KEYS[1], ARGV[1])
+for i = 1, #members, 1000 do
+    redis.call('SADD', KEYS[2], unpack(members, i, math.min(i + 999, #members)))
+end
+return members
+"""
+
+# 到期的重试成员原子地移回队列
+_PROMOTE_SCRIPT = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for i = 1, #members, 1000 do
+    local chunk = {unpack(members, i, math.min(i + 999, #members))}
+    redis.call('ZREM', KEYS[1], unpack(chunk))
+    redis.call('SADD', KEYS[2], unpack(chunk))
+end
+return #members
+"""
+
+_claim_script = sync_redis_engine.register_script(_CLAIM_SCRIPT)
+_promote_script = sync_redis_engine.register_script(_PROMOTE_SCRIPT)
+
+
+def processing_key(key: str) -> str:
+    return f"{key}{PROCESSING_SUFFIX}"
+
+
+def retry_key(key: str) -> str:
+    return f"{key}{RETRY_SUFFIX}"
+
+
+def attempts_key(key: str) -> str:
+    return f"{key}{ATTEMPTS_SUFFIX}"
+
+
+def dead_key(key: str) -> str:
+    return f"{key}{DEAD_SUFFIX}"
+
+
+def claim_queue(key: str, count: int = QUEUE_BATCH_SIZE) -> List[bytes]:
+    """
+    从队列中取出最多 count 个成员，处理完成后需要调用 ack_queue
+    """
+    return _claim_script(keys=[key, processing_key(key)], args=[count])
+
+
+def ack_queue(key: str):
+    """
+    确认 claim_queue 取出的成员已经处理完成
+    """
+    sync_redis_engine.delete(processing_key(key))
+
+
+def queue_pending(keys: List[str]) -> bool:
+    """
+    队列或者未确认的 processing 集合中是否还有成员
+    """
+    with sync_redis_engine.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.scard(key)
+            pipe.scard(processing_key(key))
+        return any(pipe.execute())
+
+
+def retry_delay(attempts: int) -> int:
+    """第 attempts 次失败后的重试间隔，指数退避"""
+    return min(QUEUE_RETRY_BASE_DELAY * 2 ** (attempts - 1), QUEUE_RETRY_MAX_DELAY)
+
+
+def schedule_retry(key: str, ids: Iterable[Any]) -> List[Any]:
+    """
+    同步失败的成员按失败次数延后放入 {key}:retry，超过最大重试次数的移入 {key}:dead
+
+    返回移入 {key}:dead 的成员
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+
+    with sync_redis_engine.pipeline(transaction=False) as pipe:
+        for _id in ids:
+            pipe.hincrby(attempts_key(key), _id, 1)
+        attempts = pipe.execute()
+
+    now = time.time()
+    retry_ids = {}
+    dead_ids = []
+    for _id, attempt in zip(ids, attempts):
+        if attempt > QUEUE_RETRY_MAX_ATTEMPTS:
+            dead_ids.append(_id)
+        else:
+            retry_ids[_id] = now + retry_delay(attempt)
+
+    with sync_redis_engine.pipeline(transaction=True) as pipe:
+        if retry_ids:
+            pipe.zadd(retry_key(key), retry_ids)
+        if dead_ids:
+            pipe.sadd(dead_key(key), *dead_ids)
+            pipe.hdel(attempts_key(key), *dead_ids)
+        pipe.execute()
+    return dead_ids
+
+
+def reset_retry_attempts(key: str, ids: Iterable[Any]):
+    """
+    同步成功或者已确认不存在的成员清除失败次数
+    """
+    ids = list(ids)
+    if ids:
+        sync_redis_engine.hdel(attempts_key(key), *ids)
+
+
+def promote_due_retries(key: str, count: int = QUEUE_BATCH_SIZE) -> int:
+    """
+    把最多 count 个已到重试时间的成员移回队列，返回移回的数量
+    """
+    return _promote_script(keys=[retry_key(key), key], args=[time.time(), count])
+
+
+def retry_failed_lookup(key: str, ids: Iterable[Any]):
+    """
+    批量请求上游失败的成员放入重试队列，不随这一批确认而丢失
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    dead_ids = schedule_retry(key, ids)
+    log.warning(
+        f"Failed to look up {len(ids)} members of {key}, {len(ids) - len(dead_ids)} scheduled to retry"
+    )
+    if dead_ids:
+        log.warning(f"Members of {key} exceeded max retry attempts: {dead_ids}")
@@ -2,44 +2,50 @@ from typing import List
 
 
 from mcim_sync.database._redis import sync_redis_engine
+from mcim_sync.queues import (
+    claim_queue,
+    ack_queue,
+    queue_pending,
+    schedule_retry,
+    reset_retry_attempts,
+    promote_due_retries,
+)
 from mcim_sync.config import Config
 
 config = Config.load()
 
+MODIDS_QUEUE_KEY = "curseforge_modids"
+FILEIDS_QUEUE_KEY = "curseforge_fileids"
+FINGERPRINTS_QUEUE_KEY = "curseforge_fingerprints"
+CURSEFORGE_QUEUE_KEYS = [MODIDS_QUEUE_KEY, FILEIDS_QUEUE_KEY, FINGERPRINTS_QUEUE_KEY]
+
 def fetch_curseforge_modids_queue() -> List[int]:
-    if sync_redis_engine.exists("curseforge_modids") == 0:
-        return []
-    modids: List[bytes] = sync_redis_engine.smembers("curseforge_modids")
-    if modids:
-        modids = [int(modid.decode("utf-8")) for modid in modids]
-    return modids
+    modids: List[bytes] = claim_queue(MODIDS_QUEUE_KEY)
+    return [int(modid.decode("utf-8")) for modid in modids]
 
 def fetch_curseforge_fileids_queue() -> List[int]:
-    if sync_redis_engine.exists("curseforge_fileids") == 0:
-        return []
-    fileids: List[bytes] = sync_redis_engine.smembers("curseforge_fileids")
-    if fileids:
-        fileids = [int(fileid.decode("utf-8")) for fileid in fileids]
-    return fileids
+    fileids: List[bytes] = claim_queue(FILEIDS_QUEUE_KEY)
+    return [int(fileid.decode("utf-8")) for fileid in fileids]
 
 def fetch_curseforge_fingerprints_queue() -> List[int]:
-    if sync_redis_engine.exists("curseforge_fingerprints") == 0:
-        return []
-    fingerprints: List[bytes] = sync_redis_engine.smembers("curseforge_fingerprints")
-    if fingerprints:
-        fingerprints = [
-            int(fingerprint.decode("utf-8")) for fingerprint in fingerprints
-        ]
-    return fingerprints
+    fingerprints: List[bytes] = claim_queue(FINGERPRINTS_QUEUE_KEY)
+    return [int(fingerprint.decode("utf-8")) for fingerprint in fingerprints]
+
+def curseforge_queues_pending() -> bool:
+    return queue_pending(CURSEFORGE_QUEUE_KEYS)
+
+def ack_curseforge_all_queues():
+    for key in CURSEFORGE_QUEUE_KEYS:
+        ack_queue(key)
 
 def clear_curseforge_modids_queue():
-    sync_redis_engine.delete("curseforge_modids")
+    sync_redis_engine.delete(MODIDS_QUEUE_KEY)
 
 def clear_curseforge_fileids_queue():
-    sync_redis_engine.delete("curseforge_fileids")
+    sync_redis_engine.delete(FILEIDS_QUEUE_KEY)
 
 def clear_curseforge_fingerprints_queue():
-    sync_redis_engine.delete("curseforge_fingerprints")
+    sync_redis_engine.delete(FINGERPRINTS_QUEUE_KEY)
 
 def clear_curseforge_all_queues():
     clear_curseforge_modids_queue()
@@ -48,4 +54,14 @@ def clear_curseforge_all_queues():
 
 def add_curseforge_modids_queue(modids: List[int]):
     if modids:
-        sync_redis_engine.sadd("curseforge_modids", *modids)
\ No newline at end of file
+        sync_redis_engine.sadd(MODIDS_QUEUE_KEY, *modids)
+
+def retry_curseforge_modids(modids: List[int]) -> List[int]:
+    dead_modids = schedule_retry(MODIDS_QUEUE_KEY, modids)
+    return [int(modid) for modid in dead_modids]
+
+def reset_curseforge_modids_attempts(modids: List[int]):
+    reset_retry_attempts(MODIDS_QUEUE_KEY, modids)
+
+def promote_curseforge_retries() -> int:
+    return sum(promote_due_retries(key) for key in CURSEFORGE_QUEUE_KEYS)
@@ -1,44 +1,72 @@
 from typing import List
 
 from mcim_sync.database._redis import sync_redis_engine
+from mcim_sync.queues import (
+    claim_queue,
+    ack_queue,
+    queue_pending,
+    schedule_retry,
+    reset_retry_attempts,
+    promote_due_retries,
+)
 from mcim_sync.config import Config
 
 config = Config.load()
+
+PROJECT_IDS_QUEUE_KEY = "modrinth_project_ids"
+VERSION_IDS_QUEUE_KEY = "modrinth_version_ids"
+HASH_ALGORITHMS = ["sha1", "sha512"]
+
+def hashes_queue_key(algorithm: str) -> str:
+    return f"modrinth_hashes_{algorithm}"
+
+MODRINTH_QUEUE_KEYS = [PROJECT_IDS_QUEUE_KEY, VERSION_IDS_QUEUE_KEY] + [
+    hashes_queue_key(algorithm) for algorithm in HASH_ALGORITHMS
+]
+
 def fetch_modrinth_project_ids_queue() -> List[str]:
-    if sync_redis_engine.exists("modrinth_project_ids") == 0:
-        return []
-    project_ids: List[bytes] = sync_redis_engine.smembers("modrinth_project_ids")
-    if project_ids:
-        project_ids = [project_id.decode("utf-8") for project_id in project_ids]
-    return project_ids
+    project_ids: List[bytes] = claim_queue(PROJECT_IDS_QUEUE_KEY)
+    return [project_id.decode("utf-8") for project_id in project_ids]
 
 def fetch_modrinth_version_ids_queue() -> List[str]:
-    if sync_redis_engine.exists("modrinth_version_ids") == 0:
-        return []
-    version_ids: List[bytes] = sync_redis_engine.smembers("modrinth_version_ids")
-    if version_ids:
-        version_ids = [version_id.decode("utf-8") for version_id in version_ids]
-    return version_ids
+    version_ids: List[bytes] = claim_queue(VERSION_IDS_QUEUE_KEY)
+    return [version_id.decode("utf-8") for version_id in version_ids]
 
 def fetch_modrinth_hashes_queue(algorithm: str) -> List[str]:
-    if sync_redis_engine.exists(f"modrinth_hashes_{algorithm}") == 0:
-        return []
-    hashes: List[bytes] = sync_redis_engine.smembers(f"modrinth_hashes_{algorithm}")
-    if hashes:
-        hashes = [hash.decode("utf-8") for hash in hashes]
-    return hashes
+    hashes: List[bytes] = claim_queue(hashes_queue_key(algorithm))
+    return [hash.decode("utf-8") for hash in hashes]
+
+def modrinth_queues_pending() -> bool:
+    return queue_pending(MODRINTH_QUEUE_KEYS)
+
+def ack_modrinth_all_queues():
+    for key in MODRINTH_QUEUE_KEYS:
+        ack_queue(key)
 
 def clear_modrinth_project_ids_queue():
-    sync_redis_engine.delete("modrinth_project_ids")
+    sync_redis_engine.delete(PROJECT_IDS_QUEUE_KEY)
 
 def clear_modrinth_version_ids_queue():
-    sync_redis_engine.delete("modrinth_version_ids")
+    sync_redis_engine.delete(VERSION_IDS_QUEUE_KEY)
 
 def clear_modrinth_hashes_queue(algorithm: str):
-    sync_redis_engine.delete(f"modrinth_hashes_{algorithm}")
+    sync_redis_engine.delete(hashes_queue_key(algorithm))
 
 def clear_modrinth_all_queues():
     clear_modrinth_project_ids_queue()
     clear_modrinth_version_ids_queue()
-    clear_modrinth_hashes_queue("sha1")
-    clear_modrinth_hashes_queue("sha512")
\ No newline at end of file
+    for algorithm in HASH_ALGORITHMS:
+        clear_modrinth_hashes_queue(algorithm)
+
+def add_modrinth_project_ids_queue(project_ids: List[str]):
+    if project_ids:
+        sync_redis_engine.sadd(PROJECT_IDS_QUEUE_KEY, *project_ids)
+
+def retry_modrinth_project_ids(project_ids: List[str]) -> List[str]:
+    return schedule_retry(PROJECT_IDS_QUEUE_KEY, project_ids)
+
+def reset_modrinth_project_ids_attempts(project_ids: List[str]):
+    reset_retry_attempts(PROJECT_IDS_QUEUE_KEY, project_ids)
+
+def promote_modrinth_retries() -> int:
+    return sum(promote_due_retries(key) for key in MODRINTH_QUEUE_KEYS)
@@ -1,6 +1,5 @@
 from typing import List, Optional
 from tenacity import retry, stop_after_attempt, wait_fixed
-from odmantic import query
 from enum import Enum
 
 from mcim_sync.models.database.curseforge import (
@@ -23,7 +22,8 @@ from mcim_sync.apis.curseforge import (
 
 from mcim_sync.models import ProjectDetail
 from mcim_sync.utils.loger import log
-from mcim_sync.utils.model_submitter import ModelSubmitter
+from mcim_sync.utils.model_submitter import ModelSubmitter, TranslationSubmitter
+from mcim_sync.tasks import iter_tasks_concurrently
 
 # from mcim_sync.utils import find_hash_in_curseforge_hashes
 from mcim_sync.database.mongodb import sync_mongo_engine, raw_mongo_client
@@ -34,6 +34,12 @@ from mcim_sync.utils.constants import ACCEPT_GAMEIDS
 config = Config.load()
 
 API = config.curseforge_api
+CURSEFORGE_INCREMENTAL_FILES: bool = config.curseforge_incremental_files
+INCREMENTAL_FILES_PAGE_SIZE = 50
+CURSEFORGE_FILES_PAGE_SIZE: int = config.curseforge_files_page_size
+CURSEFORGE_FILES_PAGE_WORKERS: int = config.curseforge_files_page_workers
+# 完整文件列表中返回条数不足的页重新拉取的轮数
+CURSEFORGE_FILES_PAGE_RETRIES = 3
 HEADERS = {
     "x-api-key": config.curseforge_api_key,
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36 Edg/116.0.1938.54",
@@ -55,6 +61,29 @@ def append_model_from_files_res(res):
             submitter.add(file_model)
 
 
+def remove_stale_files(modId: int, file_ids: List[int]) -> int:
+    """
+    删除 isAvailable 为 True 且不在 file_ids 中的文件
+
+    先用 modId_1_isAvailable_1__id_1 索引覆盖查询读出已有的文件 id，在本地求差集，
+    只按具体的 id 删除，没有需要删除的文件时不发送删除请求
+    """
+    existing_file_ids = set(
+        file["_id"]
+        for file in raw_mongo_client[File.__collection__].find(
+            {"modId": modId, "isAvailable": True}, {"_id": 1}
+        )
+    )
+    stale_file_ids = list(existing_file_ids - set(file_ids))
+    if not stale_file_ids:
+        return 0
+    return (
+        raw_mongo_client[File.__collection__]
+        .delete_many({"_id": {"$in": stale_file_ids}, "modId": modId})
+        .deleted_count
+    )
+
+
 def sync_mod_all_files(modId: int) -> int:
     params = {"index": 0, "pageSize": 50}
     file_id_list = []
@@ -84,9 +113,7 @@ def sync_mod_all_files(modId: int) -> int:
     # 特判：如果文件在文件列表中不可见而实际存在可直接按 FileId 查询，那么不删除该文件
     # 但应该在删除整个无效 Mod 的时候删除所有文件，包括该文件
 
-    removed_file_count = sync_mongo_engine.remove(
-        File, File.modId == modId, File.isAvailable == True, query.not_in(File.id, file_id_list)  # noqa: E712
-    )
+    removed_file_count = remove_stale_files(modId, file_id_list)
 
     # removed_fingerprint_count = sync_mongo_engine.remove(
     #     Fingerprint, query.not_in(Fingerprint.file.id, file_id_list)
@@ -103,54 +130,82 @@ def sync_mod_all_files(modId: int) -> int:
     return page.totalCount
 
 
-def sync_mod_all_files_at_once(modId: int) -> Optional[int]:
-    max_retries = 3
-    page_size = 10000
-    for i in range(max_retries):
-        res = get_mod_files(modId, index=0, pageSize=page_size)
+@retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
+def _fetch_mod_files_page(modId: int, index: int) -> dict:
+    return get_mod_files(modId, index=index, pageSize=CURSEFORGE_FILES_PAGE_SIZE)
 
-        file_id_list = [file["id"] for file in res["data"]]
 
-        page = Pagination(**res["pagination"])
+def sync_mod_all_files_paged(modId: int) -> Optional[int]:
+    """
+    第一页拿到 totalCount 后并发拉取剩余的页，合并为完整的文件列表再删除过期文件
+
+    上游可能把 pageSize 限制得比配置的小，翻页步长以第一页实际返回的条数为准；
+    返回条数不足的页从缺口处重新拉取，最多 CURSEFORGE_FILES_PAGE_RETRIES 轮
+
+    合并后的文件数少于 totalCount 时保存已拉取到的文件，但不删除任何文件并返回 None
+    """
+    first_page = _fetch_mod_files_page(modId, 0)
+    page = Pagination(**first_page["pagination"])
+    files = {file["id"]: file for file in first_page["data"]}
+
+    step = len(first_page["data"])
+    # (index, 期望的条数)
+    pending = []
+    if step == 0:
+        if page.totalCount > 0:
+            pending = [(0, min(CURSEFORGE_FILES_PAGE_SIZE, page.totalCount))]
+    else:
+        pending = [
+            (index, min(step, page.totalCount - index))
+            for index in range(step, page.totalCount, step)
+        ]
 
-        if page.resultCount != page.totalCount or len(file_id_list) != page.resultCount:
-            log.warning(
-                f"ResultCount {page.resultCount} != TotalCount {page.totalCount} for mod {modId}, or the count of files != resultCount, response maybe incomplete, passing sync, retrying {i + 1}/{max_retries}"
+    def fetch(item):
+        index, expected = item
+        return index, expected, _fetch_mod_files_page(modId, index)
+
+    for attempt in range(CURSEFORGE_FILES_PAGE_RETRIES + 1):
+        if not pending:
+            break
+        if attempt > 0:
+            log.debug(
+                f"Mod {modId} got {len(pending)} short pages, refetching {attempt}/{CURSEFORGE_FILES_PAGE_RETRIES}"
             )
-            # time.sleep(1)
-            page_size -= 1
-            continue
         else:
-            break
-    else:
-        log.error(
-            f"Failed to get all files for mod {modId} after {max_retries} retries"
-        )
-        return None
+            log.debug(
+                f"Mod {modId} has {page.totalCount} files, fetching {len(pending)} more pages concurrently"
+            )
+        short_pages = []
+        for index, expected, res in iter_tasks_concurrently(
+            pending,
+            fetch,
+            CURSEFORGE_FILES_PAGE_WORKERS,
+            f"fetch_curseforge_files_{modId}",
+        ):
+            files.update({file["id"]: file for file in res["data"]})
+            received = len(res["data"])
+            if received < expected:
+                # 从缺口处继续拉取
+                short_pages.append((index + received, expected - received))
+        pending = short_pages
 
     original_files_count = sync_mongo_engine.count(File, File.modId == modId)
 
-    append_model_from_files_res(res)
+    append_model_from_files_res({"data": list(files.values())})
 
-    # removed_file_count = sync_mongo_engine.remove(
-    #     File, File.modId == modId, query.not_in(File.id, file_id_list)
-    # )
+    if len(files) < page.totalCount:
+        log.warning(
+            f"Fetched {len(files)} files < TotalCount {page.totalCount} for mod {modId}, response maybe incomplete, skip removing files"
+        )
+        return None
+
+    file_id_list = list(files.keys())
 
     # https://github.com/Meloong-Git/PCL/issues/8008#issuecomment-4252789454
     # 特判：如果文件在文件列表中不可见而实际存在可直接按 FileId 查询，那么不删除该文件
     # 但应该在删除整个无效 Mod 的时候删除所有文件，包括该文件
 
-    removed_file_count = sync_mongo_engine.remove(
-        File, File.modId == modId, File.isAvailable == True, query.not_in(File.id, file_id_list)  # noqa: E712
-    )
-
-    # removed_fingerprint_count = sync_mongo_engine.remove(
-    #     Fingerprint, {"file.id": {"$nin": file_id_list}, "file.modId": modId} # 务必注意筛选 modId
-    # )
-
-    # log.info(
-    #     f"Finished sync mod {modId}, total {page.totalCount} files, removed {removed_file_count} files and {removed_fingerprint_count} fingerprints, original files {original_files_count}"
-    # )
+    removed_file_count = remove_stale_files(modId, file_id_list)
 
     log.info(
         f"Finished sync mod {modId}, total {page.totalCount} files, removed {removed_file_count} files, original files {original_files_count}"
@@ -159,11 +214,93 @@ def sync_mod_all_files_at_once(modId: int) -> Optional[int]:
     return page.totalCount
 
 
+def sync_mod_files_incremental(modId: int, mod_info: dict) -> Optional[int]:
+    """
+    从最新的文件开始翻页，遇到本地已有的文件为止，只保存新增的文件
+
+    本地没有文件，或者 totalCount、latestFilesIndexes 与本地加新增对不上时
+    （有文件被删除或者乱序），返回 None，由调用方回退到完整文件列表
+    """
+    local_files = list(
+        raw_mongo_client[File.__collection__].find(
+            {"modId": modId}, {"_id": 1, "isAvailable": 1}
+        )
+    )
+    # 特判插入的不可见文件不计入 totalCount，但仍可能出现在 latestFiles 中
+    local_file_ids = set(
+        file["_id"] for file in local_files if file.get("isAvailable") is not False
+    )
+    if not local_file_ids:
+        return None
+
+    new_files = []
+    total_count = None
+    index = 0
+    while True:
+        res = get_mod_files(modId, index=index, pageSize=INCREMENTAL_FILES_PAGE_SIZE)
+        page = Pagination(**res["pagination"])
+        if total_count is None:
+            total_count = page.totalCount
+
+        reached_known = False
+        for file in res["data"]:
+            if file["id"] in local_file_ids:
+                reached_known = True
+            else:
+                new_files.append(file)
+
+        # 整页检查完再停止
+        if reached_known or len(res["data"]) == 0:
+            break
+
+        index += INCREMENTAL_FILES_PAGE_SIZE
+        if index >= page.totalCount:
+            break
+
+    remote_file_ids = local_file_ids | {file["id"] for file in new_files}
+    if len(remote_file_ids) != total_count:
+        log.debug(
+            f"Mod {modId} local {len(local_file_ids)} + new {len(new_files)} files != totalCount {total_count}, fallback to full file list"
+        )
+        return None
+
+    latest_file_ids = [
+        file_index["fileId"] for file_index in mod_info.get("latestFilesIndexes") or []
+    ] + [file["id"] for file in mod_info.get("latestFiles") or []]
+    known_file_ids = remote_file_ids | {file["_id"] for file in local_files}
+    if any(file_id not in known_file_ids for file_id in latest_file_ids):
+        log.debug(
+            f"Mod {modId} latest files not all reached incrementally, fallback to full file list"
+        )
+        return None
+
+    if new_files:
+        append_model_from_files_res({"data": new_files})
+
+    log.info(
+        f"Finished incremental sync mod {modId}, total {total_count} files, added {len(new_files)} files"
+    )
+    return total_count
+
+
 @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
-def sync_mod(modId: int) -> Optional[ProjectDetail]:
+def sync_mod(
+    modId: int,
+    mod_info: Optional[dict] = None,
+    full: bool = False,
+    translation_submitter: Optional[TranslationSubmitter] = None,
+) -> Optional[ProjectDetail]:
+    """
+    mod_info 为已经批量拉取到的 Mod 信息，传入时不再单独请求 get_mod
+
+    full 为 False 时只同步新增的文件，full 为 True 时拉取完整文件列表，
+    用于定期纠正已有文件信息的变化
+
+    translation_submitter 为多个 Mod 共享的 TranslationSubmitter，不传时单独检查翻译
+    """
     try:
         with ModelSubmitter() as submitter:
-            res = get_mod(modId)
+            res = mod_info if mod_info is not None else get_mod(modId)
             mod_model = Mod(**res)
             if mod_model.gameId in ACCEPT_GAMEIDS:
                 # version_count = sync_mod_all_files(
@@ -171,39 +308,25 @@ def sync_mod(modId: int) -> Optional[ProjectDetail]:
                 #     # latestFiles=res["latestFiles"],
                 # )
 
-                version_count = sync_mod_all_files_at_once(
-                    modId,
-                    # latestFiles=res["latestFiles"],
-                )
+                version_count = None
+                if CURSEFORGE_INCREMENTAL_FILES and not full:
+                    version_count = sync_mod_files_incremental(modId, res)
+
+                if version_count is None:
+                    version_count = sync_mod_all_files_paged(
+                        modId,
+                        # latestFiles=res["latestFiles"],
+                    )
 
                 if version_count is None:
                     return None
 
                 # 为 mcim_translate 检查是否有翻译过或者 summary 是否有修改
-                translated_mod = sync_mongo_engine.find_one(
-                    Translation, query.eq(Translation.id, modId)
-                )
-
-                if not translated_mod:
-                    translated_mod = Translation(
-                        id=modId,
-                        translated=None,
-                        original=mod_model.summary,
-                        need_to_update=True,
-                    )
-                    log.debug(f"Mod {modId} summary not found, adding new translation")
-                    submitter.add(translated_mod)
-                elif translated_mod.original != mod_model.summary:
-                    translated_mod.original = mod_model.summary
-                    translated_mod.need_to_update = True
-                    log.debug(
-                        f"Mod {modId} summary changed, marking translation for update"
-                    )
-                    submitter.add(translated_mod)
+                if translation_submitter is not None:
+                    translation_submitter.add(modId, mod_model.summary)
                 else:
-                    log.trace(
-                        f"Mod {modId} summary not changed, no need to update translation"
-                    )
+                    with TranslationSubmitter(Translation.__collection__) as single_submitter:
+                        single_submitter.add(modId, mod_model.summary)
 
                 # 最后再添加，以防未成功刷新版本列表而更新 Mod 信息
                 submitter.add(mod_model)
@@ -3,8 +3,7 @@
 """
 
 from tenacity import retry, stop_after_attempt, wait_fixed
-from typing import List, Optional
-from odmantic import query
+from typing import Dict, List, Optional, Tuple
 
 from mcim_sync.models.database.modrinth import (
     Project,
@@ -29,15 +28,88 @@ from mcim_sync.apis.modrinth import (
 from mcim_sync.models import ProjectDetail
 from mcim_sync.exceptions import ResponseCodeException
 from mcim_sync.config import Config
-from mcim_sync.database.mongodb import sync_mongo_engine
-from mcim_sync.utils.model_submitter import ModelSubmitter
+from mcim_sync.database.mongodb import sync_mongo_engine, raw_mongo_client
+from mcim_sync.utils.model_submitter import ModelSubmitter, TranslationSubmitter
 from mcim_sync.utils.loger import log
+from mcim_sync.tasks import iter_tasks_concurrently
 
 
 config = Config.load()
 
 API = config.modrinth_api
 
+MODRINTH_LIMIT_SIZE: int = config.modrinth_chunk_size
+MAX_WORKERS: int = config.max_workers
+MODRINTH_INCREMENTAL_VERSIONS: bool = config.modrinth_incremental_versions
+
+
+def append_version_model(submitter: ModelSubmitter, version: dict):
+    for file in version["files"]:
+        file["version_id"] = version["id"]
+        file["project_id"] = version["project_id"]
+        submitter.add(File(**file))
+    submitter.add(Version(**version))
+
+def remove_stale_versions(project_id: str, version_ids: List[str]):
+    """
+    删除不在 version_ids 中的版本及其文件，返回 (删除的版本数, 删除的文件数)
+
+    已有的版本 id 和文件所属的 version_id 都通过索引覆盖查询读出，在本地求差集，
+    只按具体的 id 删除，没有需要删除的数据时不发送删除请求
+    """
+    version_id_set = set(version_ids)
+
+    existing_version_ids = set(
+        version["_id"]
+        for version in raw_mongo_client[Version.__collection__].find(
+            {"project_id": project_id}, {"_id": 1}
+        )
+    )
+    stale_version_ids = list(existing_version_ids - version_id_set)
+    removed_version_count = 0
+    if stale_version_ids:
+        removed_version_count = (
+            raw_mongo_client[Version.__collection__]
+            .delete_many({"_id": {"$in": stale_version_ids}, "project_id": project_id})
+            .deleted_count
+        )
+
+    # 文件可能属于已经不在 modrinth_versions 中的版本，单独按 version_id 比较
+    file_version_ids = set(
+        raw_mongo_client[File.__collection__].distinct(
+            "version_id", {"project_id": project_id}
+        )
+    )
+    stale_file_version_ids = list(file_version_ids - version_id_set)
+    removed_file_count = 0
+    if stale_file_version_ids:
+        removed_file_count = (
+            raw_mongo_client[File.__collection__]
+            .delete_many(
+                {"version_id": {"$in": stale_file_version_ids}, "project_id": project_id}
+            )
+            .deleted_count
+        )
+    return removed_version_count, removed_file_count
+
+
+def submit_translation(
+    translation_submitter: Optional[TranslationSubmitter],
+    project_id: str,
+    description: str,
+):
+    """
+    为 mcim_translate 检查是否有翻译过或者 description 是否有修改
+
+    不传 translation_submitter 时单独检查这一个 Project
+    """
+    if translation_submitter is not None:
+        translation_submitter.add(project_id, description)
+    else:
+        with TranslationSubmitter(Translation.__collection__) as single_submitter:
+            single_submitter.add(project_id, description)
+
+
 def sync_project_all_version(project_id: str) -> int:
     res = get_project_all_version(project_id)
     latest_version_id_list = []
@@ -48,23 +120,10 @@ def sync_project_all_version(project_id: str) -> int:
             return 0
         for version in res:
             latest_version_id_list.append(version["id"])
-            for file in version["files"]:
-                file["version_id"] = version["id"]
-                file["project_id"] = version["project_id"]
-                file_model = File(**file)
-                submitter.add(file_model)
-            submitter.add(Version(**version))
-
-        removed_version_count = sync_mongo_engine.remove(
-            Version,
-            query.not_in(Version.id, latest_version_id_list),
-            Version.project_id == project_id,
-        )
+            append_version_model(submitter, version)
 
-        removed_file_count = sync_mongo_engine.remove(
-            File,
-            query.not_in(File.version_id, latest_version_id_list),
-            File.project_id == project_id,
+        removed_version_count, removed_file_count = remove_stale_versions(
+            project_id, latest_version_id_list
         )
 
         total_count = len(res)
@@ -74,40 +133,112 @@ def sync_project_all_version(project_id: str) -> int:
         return total_count
 
 
+def sync_project_versions_incremental(
+    project_id: str, remote_version_ids: List[str]
+) -> Optional[int]:
+    """
+    按 Project.versions 与本地版本比较，只拉取新增的版本并删除源已移除的版本
+
+    本地没有版本或者拉取结果对不上时返回 None，由调用方回退到完整版本列表
+    """
+    if len(remote_version_ids) == 0:
+        return None
+
+    local_version_ids = set(
+        version["_id"]
+        for version in raw_mongo_client[Version.__collection__].find(
+            {"project_id": project_id}, {"_id": 1}
+        )
+    )
+    if not local_version_ids:
+        # 新 Project 一次拉取完整版本列表更省请求
+        return None
+
+    remote_version_id_set = set(remote_version_ids)
+    added_version_ids = [
+        version_id
+        for version_id in remote_version_ids
+        if version_id not in local_version_ids
+    ]
+    removed_version_ids = list(local_version_ids - remote_version_id_set)
+
+    added_versions = []
+    for i in range(0, len(added_version_ids), MODRINTH_LIMIT_SIZE):
+        chunk = added_version_ids[i : i + MODRINTH_LIMIT_SIZE]
+        info = fetch_multi_versions_info(version_ids=chunk)
+        if info is None:
+            return None
+        added_versions.extend(
+            version for version in info if version["project_id"] == project_id
+        )
+
+    if len(added_versions) != len(added_version_ids):
+        log.warning(
+            f"Fetched {len(added_versions)} of {len(added_version_ids)} added versions for project {project_id}, fallback to full version list"
+        )
+        return None
+
+    with ModelSubmitter() as submitter:
+        for version in added_versions:
+            append_version_model(submitter, version)
+
+    removed_version_count = 0
+    removed_file_count = 0
+    if removed_version_ids:
+        removed_version_count = (
+            raw_mongo_client[Version.__collection__]
+            .delete_many({"_id": {"$in": removed_version_ids}, "project_id": project_id})
+            .deleted_count
+        )
+        removed_file_count = (
+            raw_mongo_client[File.__collection__]
+            .delete_many(
+                {"version_id": {"$in": removed_version_ids}, "project_id": project_id}
+            )
+            .deleted_count
+        )
+
+    log.info(
+        f"Finished incremental sync project {project_id} versions info, total {len(remote_version_ids)} versions, added {len(added_versions)} versions, removed {removed_version_count} versions and {removed_file_count} files"
+    )
+    return len(remote_version_ids)
+
+
 @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
-def sync_project(project_id: str) -> Optional[ProjectDetail]:
+def sync_project(
+    project_id: str,
+    project_info: Optional[dict] = None,
+    full: bool = False,
+    translation_submitter: Optional[TranslationSubmitter] = None,
+) -> Optional[ProjectDetail]:
+    """
+    project_info 为已经批量拉取到的 Project 信息，传入时不再单独请求 get_project
+
+    full 为 False 时只同步新增和删除的版本，full 为 True 时拉取完整版本列表，
+    用于定期纠正已有版本信息的变化
+
+    translation_submitter 为多个 Project 共享的 TranslationSubmitter，不传时单独检查翻译
+    """
     try:
-        res = get_project(project_id)
+        res = project_info if project_info is not None else get_project(project_id)
         with ModelSubmitter() as submitter:
             project_model = Project(**res)
-            total_count = sync_project_all_version(
-                project_id,
-            )
+            total_count = None
+            if MODRINTH_INCREMENTAL_VERSIONS and not full:
+                total_count = sync_project_versions_incremental(
+                    project_id, res.get("versions") or []
+                )
+            if total_count is None:
+                total_count = sync_project_all_version(
+                    project_id,
+                )
             if total_count == 0:
                 return None
 
-            # 为 mcim_translate 检查是否有翻译过或者 description 是否有修改
-            translated_mod = sync_mongo_engine.find_one(
-                Translation, query.eq(Translation.id, project_id)
+            submit_translation(
+                translation_submitter, project_id, project_model.description
             )
 
-            if not translated_mod:
-                translated_mod = Translation(
-                    id=project_id,
-                    translated=None,
-                    original=project_model.description,
-                    need_to_update=True
-                )
-                log.debug(f"Project {project_id} description not found, adding new translation")
-                submitter.add(translated_mod)
-            elif translated_mod.original != project_model.description:
-                translated_mod.original = project_model.description
-                translated_mod.need_to_update = True
-                log.debug(f"Project {project_id} description changed, marking translation for update")
-                submitter.add(translated_mod)
-            else:
-                log.trace(f"Project {project_id} description not changed, no need to update translation")
-
             # 最后再添加，以防未成功刷新版本列表而更新 Project 信息
             submitter.add(project_model)
             return ProjectDetail(
@@ -121,6 +252,117 @@ def sync_project(project_id: str) -> Optional[ProjectDetail]:
             raise e
 
 
+def _fetch_versions_grouped(projects: List[dict]) -> Optional[Dict[str, List[dict]]]:
+    version_ids = [
+        version_id for project in projects for version_id in project["versions"]
+    ]
+    chunks = [
+        version_ids[i : i + MODRINTH_LIMIT_SIZE]
+        for i in range(0, len(version_ids), MODRINTH_LIMIT_SIZE)
+    ]
+    grouped_versions: Dict[str, List[dict]] = {
+        project["id"]: [] for project in projects
+    }
+    for info in iter_tasks_concurrently(
+        chunks,
+        lambda chunk: fetch_multi_versions_info(version_ids=chunk),
+        MAX_WORKERS,
+        "fetch_modrinth_versions",
+    ):
+        if info is None:
+            return None
+        for version in info:
+            if version["project_id"] in grouped_versions:
+                grouped_versions[version["project_id"]].append(version)
+    return grouped_versions
+
+
+def _save_project_with_versions(
+    project: dict,
+    versions: List[dict],
+    translation_submitter: Optional[TranslationSubmitter] = None,
+) -> ProjectDetail:
+    project_id = project["id"]
+    with ModelSubmitter() as submitter:
+        project_model = Project(**project)
+        for version in versions:
+            append_version_model(submitter, version)
+        removed_version_count, removed_file_count = remove_stale_versions(
+            project_id, [version["id"] for version in versions]
+        )
+        submit_translation(translation_submitter, project_id, project_model.description)
+        # 最后再添加，以防未成功刷新版本列表而更新 Project 信息
+        submitter.add(project_model)
+    log.info(
+        f"Finished batch sync project {project_id} versions info, total {len(versions)} versions, removed {removed_version_count} versions and {removed_file_count} files"
+    )
+    return ProjectDetail(id=project_id, name=project["slug"], version_count=len(versions))
+
+
+def sync_projects_batch(
+    projects: List[dict],
+    translation_submitter: Optional[TranslationSubmitter] = None,
+) -> Tuple[List[ProjectDetail], List[str]]:
+    """
+    projects 为 /v2/projects 返回的 Project 信息
+
+    把多个 Project 的版本打包到 /v2/versions?ids= 批量拉取，再按 project_id 分组保存，
+    新 Project 不再各自请求一次完整版本列表
+
+    返回同步成功的 ProjectDetail，以及需要逐个 sync_project 的 project_id
+    （版本过多、没有版本或者批量结果对不上的 Project）
+    """
+    projects_detail_info: List[ProjectDetail] = []
+    fallback_project_ids: List[str] = []
+
+    batch_projects = []
+    for project in projects:
+        versions = project.get("versions") or []
+        # 版本很多的 Project 请求一次完整版本列表更划算
+        if len(versions) == 0 or len(versions) > MODRINTH_LIMIT_SIZE:
+            fallback_project_ids.append(project["id"])
+        else:
+            batch_projects.append(project)
+
+    # 按版本数分组，控制同时在内存中的版本数量
+    groups: List[List[dict]] = []
+    group_version_count = 0
+    for project in batch_projects:
+        if not groups or group_version_count >= MODRINTH_LIMIT_SIZE * MAX_WORKERS:
+            groups.append([])
+            group_version_count = 0
+        groups[-1].append(project)
+        group_version_count += len(project["versions"])
+
+    for group in groups:
+        grouped_versions = _fetch_versions_grouped(group)
+        if grouped_versions is None:
+            fallback_project_ids.extend(project["id"] for project in group)
+            continue
+        for project in group:
+            versions = grouped_versions[project["id"]]
+            if len(versions) != len(project["versions"]):
+                log.debug(
+                    f"Fetched {len(versions)} of {len(project['versions'])} versions for project {project['id']}, fallback to sync_project"
+                )
+                fallback_project_ids.append(project["id"])
+                continue
+            try:
+                projects_detail_info.append(
+                    _save_project_with_versions(
+                        project, versions, translation_submitter
+                    )
+                )
+            except Exception as e:
+                log.error(f"Failed to batch sync project {project['id']}: {e}")
+                fallback_project_ids.append(project["id"])
+
+    log.info(
+        f"Batch synced {len(projects_detail_info)} projects, {len(fallback_project_ids)} projects fallback to sync_project"
+    )
+    return projects_detail_info, fallback_project_ids
+
+
 @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
 def sync_categories() -> List[dict]:
     sync_mongo_engine.remove(Category)
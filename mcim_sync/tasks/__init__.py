@@ -1,5 +1,13 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from contextlib import contextmanager
+from queue import Queue
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+import threading
+
+from mcim_sync.utils.loger import log
+
+_PIPELINE_STOP = object()
+
 
 @contextmanager
 def create_tasks_pool(sync_function, data, max_workers, thread_name_prefix):
@@ -8,7 +16,7 @@ def create_tasks_pool(sync_function, data, max_workers, thread_name_prefix):
         max_workers=max_workers,
         thread_name_prefix=thread_name_prefix
     )
-    
+
     try:
         # 提交所有任务
         futures = [
@@ -16,4 +24,129 @@ def create_tasks_pool(sync_function, data, max_workers, thread_name_prefix):
         ]
         yield futures
     finally:
-        thread_pool.shutdown(wait=True)
\ No newline at end of file
+        thread_pool.shutdown(wait=True)
+
+
+def iter_tasks_concurrently(
+    data: Iterable,
+    function: Callable,
+    max_workers: int,
+    thread_name_prefix: str,
+) -> Iterator:
+    """
+    并发执行每个任务，同时在途的任务不超过 max_workers 个，结果按完成顺序产出
+
+    data 可以是生成器，按需拉取；请求频率由域名限速器控制，这里不再额外 sleep
+    """
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix=thread_name_prefix
+    ) as thread_pool:
+        pending = set()
+        for item in data:
+            pending.add(thread_pool.submit(function, item))
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def run_tasks_pipeline(
+    source: Iterable,
+    check_function: Callable[[Any], Iterable],
+    sync_function: Callable[[Any], Any],
+    max_workers: int,
+    thread_name_prefix: str,
+    check_workers: int = 1,
+    queue_size: int = 4,
+    unique: bool = False,
+) -> List[Tuple[Any, Any]]:
+    """
+    流水线执行 拉取 -> 检查 -> 同步
+
+    source 逐块产出待检查的数据，check_function 检查一块并返回需要同步的项，
+    每一项立即交给同步线程，不必等待全部检查结束。
+    阶段之间是有界队列，下游处理不过来时上游阻塞等待，内存占用有上限。
+
+    unique 为 True 时同一个 item 只会同步一次
+
+    返回所有 (item, result)，同步时抛出异常的 item 对应 result 为 None
+    """
+    chunk_queue: Queue = Queue(maxsize=queue_size)
+    item_queue: Queue = Queue(maxsize=max_workers * queue_size)
+    results: List[Tuple[Any, Any]] = []
+    results_lock = threading.Lock()
+    seen_items = set()
+    seen_lock = threading.Lock()
+
+    def fetch_stage():
+        try:
+            for chunk in source:
+                chunk_queue.put(chunk)
+        except Exception as e:
+            log.error(f"Pipeline {thread_name_prefix} fetch stage failed: {e}")
+        finally:
+            for _ in range(check_workers):
+                chunk_queue.put(_PIPELINE_STOP)
+
+    def check_stage():
+        while True:
+            chunk = chunk_queue.get()
+            if chunk is _PIPELINE_STOP:
+                break
+            try:
+                for item in check_function(chunk):
+                    if unique:
+                        with seen_lock:
+                            if item in seen_items:
+                                continue
+                            seen_items.add(item)
+                    item_queue.put(item)
+            except Exception as e:
+                log.error(f"Pipeline {thread_name_prefix} check stage failed: {e}")
+
+    def sync_stage():
+        while True:
+            item = item_queue.get()
+            if item is _PIPELINE_STOP:
+                break
+            try:
+                result = sync_function(item)
+            except Exception as e:
+                log.error(f"Pipeline {thread_name_prefix} failed to sync {item}: {e}")
+                result = None
+            with results_lock:
+                results.append((item, result))
+
+    fetch_thread = threading.Thread(
+        target=fetch_stage, name=f"{thread_name_prefix}_fetch", daemon=True
+    )
+    check_threads = [
+        threading.Thread(
+            target=check_stage, name=f"{thread_name_prefix}_check_{i}", daemon=True
+        )
+        for i in range(check_workers)
+    ]
+    sync_threads = [
+        threading.Thread(
+            target=sync_stage, name=f"{thread_name_prefix}_{i}", daemon=True
+        )
+        for i in range(max_workers)
+    ]
+
+    for thread in [fetch_thread, *check_threads, *sync_threads]:
+        thread.start()
+
+    fetch_thread.join()
+    for thread in check_threads:
+        thread.join()
+    # 检查阶段全部结束后才通知同步线程退出
+    for _ in sync_threads:
+        item_queue.put(_PIPELINE_STOP)
+    for thread in sync_threads:
+        thread.join()
+
+    return results
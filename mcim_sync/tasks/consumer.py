@@ -0,0 +1,194 @@
+from typing import Callable, List, Optional, Tuple
+import threading
+
+from redis.exceptions import RedisError
+
+from mcim_sync.database._redis import sync_redis_engine
+from mcim_sync.utils.loger import log
+from mcim_sync.config import Config
+from mcim_sync.models.database.curseforge import Translation
+from mcim_sync.utils.model_submitter import TranslationSubmitter
+from mcim_sync.queues.curseforge import (
+    CURSEFORGE_QUEUE_KEYS,
+    curseforge_queues_pending,
+    promote_curseforge_retries,
+)
+from mcim_sync.queues.modrinth import (
+    MODRINTH_QUEUE_KEYS,
+    modrinth_queues_pending,
+    promote_modrinth_retries,
+)
+from mcim_sync.tasks.curseforge import sync_curseforge_queue_batch
+from mcim_sync.tasks.modrinth import sync_modrinth_queue_batch
+
+config = Config.load()
+
+# 收到通知后等待一小段时间，把同一时间段内加入的成员合并成一批
+QUEUE_CONSUMER_LINGER: float = config.queue_consumer_linger
+# 收不到键空间通知时的轮询间隔（秒）
+QUEUE_CONSUMER_POLL_INTERVAL: float = config.queue_consumer_poll_interval
+# 是否订阅键空间通知，需要修改 Redis 配置，默认只轮询
+QUEUE_CONSUMER_KEYSPACE_EVENTS: bool = config.queue_consumer_keyspace_events
+# 出错后重新订阅前的等待时间（秒）
+QUEUE_CONSUMER_RETRY_DELAY = 5
+
+
+def _enable_keyspace_notifications() -> bool:
+    """
+    确保 Redis 开启了集合命令的键空间通知（K + s），托管的 Redis 可能不允许 CONFIG SET
+    """
+    try:
+        value = next(
+            iter(sync_redis_engine.config_get("notify-keyspace-events").values()), ""
+        )
+        events = value.decode("utf-8") if isinstance(value, bytes) else value
+        if "K" in events and ("s" in events or "A" in events):
+            return True
+        sync_redis_engine.config_set("notify-keyspace-events", f"{events}Ks")
+        log.info("Enabled redis keyspace notifications for set commands")
+        return True
+    except RedisError as e:
+        log.warning(
+            f"Failed to enable redis keyspace notifications, fall back to polling every {QUEUE_CONSUMER_POLL_INTERVAL}s: {e}"
+        )
+        return False
+
+
+def _consume_curseforge() -> Tuple[List[int], list]:
+    with TranslationSubmitter(Translation.__collection__) as translation_submitter:
+        return sync_curseforge_queue_batch(translation_submitter)
+
+
+# (平台, 移回到期的重试成员, 是否有待处理成员, 处理一批)
+QUEUE_CONSUMERS: List[
+    Tuple[str, Callable[[], int], Callable[[], bool], Callable[[], tuple]]
+] = [
+    (
+        "curseforge",
+        promote_curseforge_retries,
+        curseforge_queues_pending,
+        _consume_curseforge,
+    ),
+    (
+        "modrinth",
+        promote_modrinth_retries,
+        modrinth_queues_pending,
+        sync_modrinth_queue_batch,
+    ),
+]
+
+
+class QueueConsumer:
+    """
+    常驻的队列消费者，API 前端把 id 加入队列后立即同步，不必等待定时任务
+
+    默认按 poll_interval 轮询；启用 keyspace_events 时订阅队列 key 的键空间通知，
+    收到后等待 linger 时间合并成一批再处理，通知不可用或者丢失时仍按轮询兜底。
+    请求仍然经过域名限速，不会增加上游的请求频率
+
+    和定时的队列任务共用 processing 集合，不能同时启用
+    """
+
+    def __init__(
+        self,
+        linger: float = QUEUE_CONSUMER_LINGER,
+        poll_interval: float = QUEUE_CONSUMER_POLL_INTERVAL,
+        keyspace_events: bool = QUEUE_CONSUMER_KEYSPACE_EVENTS,
+    ):
+        self.linger = linger
+        self.poll_interval = poll_interval
+        self.keyspace_events = keyspace_events
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _channels(self) -> List[str]:
+        # 只订阅队列本身；取出成员时的 SPOP（以及集合清空时的 DEL）也会产生通知，
+        # 处理完一轮后由 _drain_events 丢弃
+        return [
+            f"__keyspace@{config.redis.database}__:{key}"
+            for key in CURSEFORGE_QUEUE_KEYS + MODRINTH_QUEUE_KEYS
+        ]
+
+    def _pending(self) -> bool:
+        return any(pending() for _, _, pending, _ in QUEUE_CONSUMERS)
+
+    def consume(self):
+        """
+        处理各平台队列中的全部成员，到期的重试成员在轮询时一并移回队列
+
+        各平台轮流每次处理一批，一个平台持续有新成员时不会饿死另一个平台
+        """
+        for _, promote_retries, _, _ in QUEUE_CONSUMERS:
+            promote_retries()
+        while not self._stop_event.is_set():
+            consumed = False
+            for platform, _, pending, consume_batch in QUEUE_CONSUMERS:
+                if self._stop_event.is_set() or not pending():
+                    continue
+                ids, projects_detail_info = consume_batch()
+                consumed = True
+                log.info(
+                    f"Queue consumer synced {platform} batch, total: {len(ids)}, synced: {len(projects_detail_info)}"
+                )
+            if not consumed:
+                break
+
+    def _drain_events(self, pubsub):
+        """丢弃已经收到的通知，包括自己取出成员时产生的"""
+        if pubsub is None:
+            return
+        while pubsub.get_message(timeout=0) is not None:
+            pass
+
+    def _wait_for_events(self, pubsub) -> bool:
+        """等待通知，返回是否收到；收到后在 linger 时间内继续合并后续通知"""
+        if pubsub is None:
+            self._stop_event.wait(self.poll_interval)
+            return False
+        message = pubsub.get_message(timeout=self.poll_interval)
+        if message is None:
+            return False
+        self._stop_event.wait(self.linger)
+        self._drain_events(pubsub)
+        return True
+
+    def _run_once(self):
+        pubsub = None
+        if self.keyspace_events and _enable_keyspace_notifications():
+            pubsub = sync_redis_engine.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(*self._channels())
+        try:
+            while not self._stop_event.is_set():
+                # 启动时先处理已有的成员，包括上次未确认的 processing 集合
+                self.consume()
+                self._drain_events(pubsub)
+                # 丢弃通知期间 API 前端新加入的成员不等通知，直接进入下一轮
+                if self._pending():
+                    continue
+                self._wait_for_events(pubsub)
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+    def run(self):
+        log.info(
+            f"Queue consumer started, keyspace events: {self.keyspace_events}, poll interval: {self.poll_interval}s"
+        )
+        while not self._stop_event.is_set():
+            try:
+                self._run_once()
+            except Exception as e:
+                log.error(f"Queue consumer failed: {e}")
+                self._stop_event.wait(QUEUE_CONSUMER_RETRY_DELAY)
+        log.info("Queue consumer stopped")
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name="queue_consumer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
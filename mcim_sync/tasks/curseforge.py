@@ -1,5 +1,6 @@
 from concurrent.futures import as_completed
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+import datetime
 
 from mcim_sync.utils.loger import log
 from mcim_sync.utils.constants import Platform
@@ -11,52 +12,150 @@ from mcim_sync.utils.telegram import (
 )
 from mcim_sync.config import Config
 from mcim_sync.models import ProjectDetail
+from mcim_sync.models.database.curseforge import Translation
+from mcim_sync.utils.model_submitter import TranslationSubmitter
 from mcim_sync.utils.constants import GAME_432_CLASSES_INFO
 from mcim_sync.sync.curseforge import sync_mod, sync_categories
 from mcim_sync.checker.curseforge import (
     check_curseforge_modids_available,
     check_curseforge_fileids_available,
     check_curseforge_fingerprints_available,
+    fetch_curseforge_mods_info,
     check_new_modids,
     check_newest_search_result,
+    check_updated_search_result,
+)
+from mcim_sync.cursors.curseforge import (
+    get_curseforge_updated_watermark,
+    set_curseforge_updated_watermark,
 )
 from mcim_sync.fetcher.curseforge import (
     fetch_expired_curseforge_data,
     fetch_all_curseforge_data,
+    iter_curseforge_check_chunks,
+    check_expired_curseforge_chunk,
+)
+from mcim_sync.cleaner.curseforge import confirm_dead_modids, remove_mods
+from mcim_sync.queues.curseforge import (
+    ack_curseforge_all_queues,
+    add_curseforge_modids_queue,
+    curseforge_queues_pending,
+    promote_curseforge_retries,
+    reset_curseforge_modids_attempts,
+    retry_curseforge_modids,
 )
-from mcim_sync.queues.curseforge import clear_curseforge_all_queues, add_curseforge_modids_queue
-from mcim_sync.tasks import create_tasks_pool
+from mcim_sync.tasks import create_tasks_pool, run_tasks_pipeline
 
 config = Config.load()
 
 
 MAX_WORKERS: int = config.max_workers
+CHECK_WORKERS: int = config.check_workers
+PIPELINE_QUEUE_SIZE: int = config.pipeline_queue_size
+QUEUE_MAX_BATCHES: int = config.queue_max_batches
+MODIFY_DATE_REFRESH_FULL: bool = config.modify_date_refresh_full
 
 
-def refresh_curseforge_with_modify_date() -> bool:
-    log.info("Start fetching expired CurseForge data.")
+def _filter_curseforge_modids(modids) -> List[int]:
+    # 到底哪来的的 wow，排除小于 30000 的 modid
+    return [modid for modid in modids if modid >= 30000]
 
-    curseforge_expired_modids = fetch_expired_curseforge_data()
 
-    # 到底哪来的的 wow，排除小于 30000 的 modid
-    curseforge_expired_modids = [
-        modid for modid in curseforge_expired_modids if modid >= 30000
-    ]
+def _sync_mod_with_info(
+    mods_info: Dict[int, Optional[dict]],
+    translation_submitter: Optional[TranslationSubmitter] = None,
+    full: bool = False,
+):
+    """
+    返回使用已拉取 Mod 信息的 sync_mod，同步后释放对应的 Mod 信息
 
-    log.info(f"Curseforge expired data fetched: {len(curseforge_expired_modids)}")
-    log.info("Start syncing CurseForge expired data...")
+    同一任务中的 Mod 共享 translation_submitter，翻译检查按批进行
+    """
 
-    with create_tasks_pool(
-        sync_mod,
-        curseforge_expired_modids,
-        MAX_WORKERS,
-        "refresh_curseforge",
-    ) as curseforge_futures:
-        projects_detail_info: List[ProjectDetail] = []
-        for future in as_completed(curseforge_futures):
-            result = future.result()
-            if result:
-                projects_detail_info.append(result)
+    def sync(modid: int):
+        return sync_mod(
+            modid,
+            mod_info=mods_info.pop(modid, None),
+            full=full,
+            translation_submitter=translation_submitter,
+        )
+
+    return sync
+
+
+def refresh_curseforge_with_modify_date() -> bool:
+    log.info("Start fetching expired CurseForge data.")
+
+    if config.refresh_pipeline:
+        log.info("Start syncing CurseForge expired data in pipeline...")
+        expired_mods_info: Dict[int, Optional[dict]] = {}
+        missing_modids = []
+
+        def check_chunk(mods: List[dict]) -> List[int]:
+            expired, missing = check_expired_curseforge_chunk(mods)
+            missing_modids.extend(missing)
+            # 只保留会被同步的 Mod 信息，同步后随之释放
+            expired_modids = _filter_curseforge_modids(expired)
+            expired_mods_info.update({modid: expired[modid] for modid in expired_modids})
+            return expired_modids
+
+        with TranslationSubmitter(Translation.__collection__) as translation_submitter:
+            results = run_tasks_pipeline(
+                iter_curseforge_check_chunks(),
+                check_chunk,
+                _sync_mod_with_info(
+                    expired_mods_info,
+                    translation_submitter,
+                    full=MODIFY_DATE_REFRESH_FULL,
+                ),
+                MAX_WORKERS,
+                "refresh_curseforge",
+                check_workers=CHECK_WORKERS,
+                queue_size=PIPELINE_QUEUE_SIZE,
+            )
+        curseforge_expired_modids = [modid for modid, _ in results]
+        projects_detail_info: List[ProjectDetail] = [
+            result for _, result in results if result
+        ]
+        log.info(f"Curseforge expired data fetched: {len(curseforge_expired_modids)}")
+    else:
+        expired_mods_info, missing_modids = fetch_expired_curseforge_data()
+        curseforge_expired_modids = _filter_curseforge_modids(expired_mods_info)
+
+        log.info(f"Curseforge expired data fetched: {len(curseforge_expired_modids)}")
+        log.info("Start syncing CurseForge expired data...")
+
+        with TranslationSubmitter(
+            Translation.__collection__
+        ) as translation_submitter, create_tasks_pool(
+            _sync_mod_with_info(
+                expired_mods_info,
+                translation_submitter,
+                full=MODIFY_DATE_REFRESH_FULL,
+            ),
+            curseforge_expired_modids,
+            MAX_WORKERS,
+            "refresh_curseforge",
+        ) as curseforge_futures:
+            results = []
+            projects_detail_info = []
+            for modid, future in zip(curseforge_expired_modids, curseforge_futures):
+                result = future.result()
+                results.append((modid, result))
+                if result:
+                    projects_detail_info.append(result)
+
+    # 批量接口没有返回的 mod，以及 sync_mod 时 404 的 mod，逐个确认后删除
+    dead_candidates = set(missing_modids) | {
+        modid for modid, result in results if result is False
+    }
+    if dead_candidates:
+        log.info(f"Start confirming curseforge missing mods: {len(dead_candidates)}")
+        dead_modids = confirm_dead_modids(list(dead_candidates))
+        if dead_modids:
+            remove_mods(dead_modids)
+            log.info(f"Removed {len(dead_modids)} curseforge dead mods.")
+            log.debug(f"CurseForge removed mods: {dead_modids}")
 
     success_modids = [project.id for project in projects_detail_info if project]
 
@@ -83,26 +182,117 @@ def refresh_curseforge_with_modify_date() -> bool:
     return True
 
 
-def fetch_curseforge_not_found_ids_from_queue():
-    modids = []
-    avaliable_modids = check_curseforge_modids_available()
-    modids.extend(avaliable_modids)
-    log.info(f"CurseForge modids queue available modids: {len(avaliable_modids)}")
+def refresh_curseforge_incremental(
+    gameId: int = 432, classes_info: List[dict] = GAME_432_CLASSES_INFO
+) -> bool:
+    """
+    按 LastUpdated 倒序搜索，只同步 dateModified 晚于上次水位线的 Mod
+
+    全量的 refresh_curseforge_with_modify_date 作为每日一致性检查
+    """
+    log.info(f"Start fetching updated CurseForge mods by search. (gameId: {gameId})")
+    updated_mods: Dict[int, Optional[dict]] = {}
+    new_watermarks = {}
+
+    for class_info in classes_info:
+        classId = class_info["id"]
+        class_name = class_info["name"]
+        watermark = get_curseforge_updated_watermark(gameId, classId)
+        if watermark is None:
+            # 首次运行没有水位线，从当前时间开始记录，之前的更新交给全量检查
+            set_curseforge_updated_watermark(
+                gameId, classId, datetime.datetime.utcnow()
+            )
+            log.info(
+                f"Watermark initialized for classId: {classId}, name: {class_name}"
+            )
+            continue
+
+        result, newest_date = check_updated_search_result(
+            gameId=gameId, classId=classId, watermark=watermark
+        )
+        updated_mods.update(result)
+        if newest_date is not None and newest_date > watermark:
+            new_watermarks[classId] = newest_date
+        log.info(
+            f"Updated modids fetched for classId {classId} name {class_name}: {len(result)}"
+        )
+
+    updated_modids = _filter_curseforge_modids(updated_mods.keys())
+    # 搜索结果中已有完整的 Mod 信息，同步时不再逐个请求 get_mod
+    mods_info = {modid: updated_mods[modid] for modid in updated_modids}
+    log.info(f"CurseForge updated modids fetched: {len(updated_modids)}")
+
+    projects_detail_info: List[ProjectDetail] = []
+    if updated_modids:
+        with TranslationSubmitter(
+            Translation.__collection__
+        ) as translation_submitter, create_tasks_pool(
+            _sync_mod_with_info(mods_info, translation_submitter),
+            updated_modids,
+            MAX_WORKERS,
+            "refresh_curseforge_incremental",
+        ) as futures:
+            for future in as_completed(futures):
+                result = future.result()
+                if result:
+                    projects_detail_info.append(result)
+
+    # 失败的 Mod 留给每日全量检查，水位线照常推进，避免卡在同一批 Mod 上；
+    # 没有完整遍历到水位线的分类 newest_date 为 None，保留旧水位线
+    for classId, newest_date in new_watermarks.items():
+        set_curseforge_updated_watermark(gameId, classId, newest_date)
+
+    failed_count = len(updated_modids) - len(projects_detail_info)
+    log.info(
+        f"CurseForge incremental refresh finished, total: {len(updated_modids)}, "
+        f"success: {len(projects_detail_info)}, failed: {failed_count}"
+    )
+
+    if config.telegram_bot and updated_modids:
+        notification = RefreshNotification(
+            platform=Platform.CURSEFORGE,
+            projects_detail_info=projects_detail_info,
+            failed_count=failed_count,
+        )
+        notification.send_to_telegram()
+        log.info("CurseForge refresh message sent to telegram.")
+
+    return True
+
+
+def fetch_curseforge_not_found_ids_from_queue() -> Dict[int, Optional[dict]]:
+    """
+    返回队列中有效的 modid 及其 Mod 信息，没能批量拉取到信息的为 None
+    """
+    mods_info: Dict[int, Optional[dict]] = {}
+    avaliable_mods_info = check_curseforge_modids_available()
+    mods_info.update(avaliable_mods_info)
+    log.info(f"CurseForge modids queue available modids: {len(avaliable_mods_info)}")
     avaliable_modids = check_curseforge_fileids_available()
-    modids.extend(avaliable_modids)
+    mods_info.update({modid: None for modid in avaliable_modids if modid not in mods_info})
     log.info(f"CurseForge fileids queue available modids: {len(avaliable_modids)}")
     avaliable_modids = check_curseforge_fingerprints_available()
-    modids.extend(avaliable_modids)
+    mods_info.update({modid: None for modid in avaliable_modids if modid not in mods_info})
     log.info(f"CurseForge fingerprints queue available modids: {len(avaliable_modids)}")
 
-    modids = [modid for modid in modids if modid >= 30000]  # 排除掉 0-30000 的 modid
-    return modids
+    # 文件和指纹只给出 modid，统一批量拉取一次 Mod 信息
+    missing_modids = [modid for modid, info in mods_info.items() if info is None]
+    if missing_modids:
+        mods_info.update(fetch_curseforge_mods_info(missing_modids))
 
+    # 排除掉 0-30000 的 modid
+    return {modid: info for modid, info in mods_info.items() if modid >= 30000}
 
-def sync_curseforge_queue() -> bool:
-    log.info("Start fetching curseforge queue.")
 
-    modids = fetch_curseforge_not_found_ids_from_queue()
+def sync_curseforge_queue_batch(
+    translation_submitter: Optional[TranslationSubmitter] = None,
+) -> Tuple[List[int], List[ProjectDetail]]:
+    """
+    从各队列取出一批并同步，处理完成后确认；返回这一批的 modid 和同步结果
+    """
+    mods_info = fetch_curseforge_not_found_ids_from_queue()
+    modids = list(mods_info.keys())
 
     # 检查这些 modid 是否是新的
     new_modids = check_new_modids(modids=modids)
@@ -111,28 +301,75 @@ def sync_curseforge_queue() -> bool:
     # https://github.com/Meloong-Git/PCL/issues/8008 有 Mod 存在更新了 Mod 信息但是实际上漏文件了，但是漏文件不算入 check_new_modids，先抛弃 check_new_modids
     # if new_modids:
     failed_modids = set()
-    with create_tasks_pool(
-        # sync_mod, new_modids, MAX_WORKERS, "sync_curseforge_queue"
-        sync_mod, modids, MAX_WORKERS, "sync_curseforge_queue"
-    ) as futures:
-        projects_detail_info = []
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                projects_detail_info.append(result)
-            elif result == False:
-                # 只有当 sync_mod 返回 False 的时候才认为是 modid 不存在，其他情况都认为是同步失败
-                failed_modids.add(result)
+    projects_detail_info = []
+    if modids:
+        with create_tasks_pool(
+            # sync_mod, new_modids, MAX_WORKERS, "sync_curseforge_queue"
+            _sync_mod_with_info(mods_info, translation_submitter),
+            modids,
+            MAX_WORKERS,
+            "sync_curseforge_queue",
+        ) as futures:
+            future_modids = dict(zip(futures, modids))
+            for future in as_completed(futures):
+                modid = future_modids[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    log.error(f"Failed to sync mod {modid}: {e}")
+                    failed_modids.add(modid)
+                    continue
+                if result:
+                    projects_detail_info.append(result)
+                elif result == False:
+                    # sync_mod 返回 False 说明 modid 暂时不存在，稍后重试
+                    failed_modids.add(modid)
 
-    log.info(f"CurseForge queue sync finished, total: {len(modids)}")
+    # 只确认这一批取出的成员，期间新加入队列的留给下一批
+    ack_curseforge_all_queues()
 
-    # clear queue
-    clear_curseforge_all_queues()
-    log.info("CurseForge queue cleared, leaving failed modids in queue for next sync.")
+    # 失败的 modid 按失败次数延后重试，不再每次都重新请求
+    reset_curseforge_modids_attempts(
+        [modid for modid in modids if modid not in failed_modids]
+    )
+    if failed_modids:
+        dead_modids = retry_curseforge_modids(list(failed_modids))
+        log.info(
+            f"Failed modids scheduled to retry: {failed_modids - set(dead_modids)}"
+        )
+        if dead_modids:
+            log.warning(f"Modids exceeded max retry attempts: {dead_modids}")
+
+    return modids, projects_detail_info
 
-    # add failed modids back to queue
-    add_curseforge_modids_queue(list(failed_modids))
-    log.info(f"Failed modids added back to queue: {failed_modids}")
+
+def sync_curseforge_queue() -> bool:
+    log.info("Start fetching curseforge queue.")
+
+    modids: List[int] = []
+    projects_detail_info: List[ProjectDetail] = []
+    promoted_count = promote_curseforge_retries()
+    if promoted_count:
+        log.info(f"{promoted_count} modids due to retry moved back to queue")
+
+    with TranslationSubmitter(Translation.__collection__) as translation_submitter:
+        for batch in range(QUEUE_MAX_BATCHES):
+            if not curseforge_queues_pending():
+                break
+            batch_modids, batch_projects_detail_info = sync_curseforge_queue_batch(
+                translation_submitter
+            )
+            modids.extend(batch_modids)
+            projects_detail_info.extend(batch_projects_detail_info)
+            log.info(
+                f"CurseForge queue batch {batch + 1} finished, total: {len(batch_modids)}"
+            )
+        else:
+            log.info(
+                f"Reached queue max batches {QUEUE_MAX_BATCHES}, leaving the rest for next sync"
+            )
+
+    log.info(f"CurseForge queue sync finished, total: {len(modids)}")
 
     if config.telegram_bot:
         notice = QueueSyncNotification(
@@ -172,35 +409,49 @@ def sync_curseforge_by_search(gameId: int = 432, classes_info: Optional[List[dic
     ?gameId=432&classId=6&sortField=11&sortOrder=desc
     """
     log.info(f"Start fetching new curseforge mod by search. (gameId: {gameId})")
-    new_modids = []
+    # 搜索结果中已有完整的 Mod 信息，同步时不再逐个请求 get_mod
+    new_mods: Dict[int, Optional[dict]] = {}
 
-    for class_info in classes_info:
+    def check_class(class_info: dict) -> List[int]:
         classId = class_info["id"]
         class_name = class_info["name"]
         log.info(
             f"Fetching new curseforge mod by search, classId: {classId}, name: {class_name}"
         )
         result = check_newest_search_result(gameId=gameId, classId=classId)
-        new_modids.extend(result)
         log.info(
             f"New modids fetched for classId {classId} name {class_name}: {len(result)}"
         )
-
-    new_modids = list(set(new_modids))  # 去重
+        new_mods.update(result)
+        return list(result.keys())
+
+    # 各分类并发搜索，搜到的新 modid 立即交给同步线程
+    with TranslationSubmitter(Translation.__collection__) as translation_submitter:
+        results = run_tasks_pipeline(
+            classes_info,
+            check_class,
+            _sync_mod_with_info(new_mods, translation_submitter),
+            MAX_WORKERS,
+            "sync_curseforge_by_search",
+            check_workers=max(len(classes_info), 1),
+            queue_size=PIPELINE_QUEUE_SIZE,
+            unique=True,
+        )
+    new_modids = [modid for modid, _ in results]
+    projects_detail_info = [result for _, result in results if result]
 
     log.info(f"CurseForge new modids fetched: {len(new_modids)}")
     if new_modids:
-        with create_tasks_pool(
-            sync_mod, new_modids, MAX_WORKERS, "sync_curseforge_by_search"
-        ) as futures:
-            projects_detail_info = []
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    projects_detail_info.append(result)
-
         log.info(f"CurseForge search sync finished, total: {len(new_modids)}")
 
+        # 搜索游标已经越过这些 mod，同步失败的放回队列由队列任务重试
+        failed_modids = set(new_modids) - {
+            project.id for project in projects_detail_info
+        }
+        if failed_modids:
+            add_curseforge_modids_queue(list(failed_modids))
+            log.info(f"Failed modids added to queue: {failed_modids}")
+
         if config.telegram_bot:
             notice = SearchSyncNotification(
                 platform=Platform.CURSEFORGE,
@@ -220,8 +471,13 @@ def sync_curseforge_full():
     curseforge_data = fetch_all_curseforge_data()
     log.info(f"Curseforge data totally fetched: {len(curseforge_data)}")
 
-    with create_tasks_pool(
-        sync_mod, curseforge_data, MAX_WORKERS, "curseforge_refresh_full"
+    with TranslationSubmitter(
+        Translation.__collection__
+    ) as translation_submitter, create_tasks_pool(
+        _sync_mod_with_info({}, translation_submitter, full=True),
+        curseforge_data,
+        MAX_WORKERS,
+        "curseforge_refresh_full",
     ) as curseforge_futures:
         log.info(
             f"All {len(curseforge_futures)} tasks submitted, waiting for completion..."
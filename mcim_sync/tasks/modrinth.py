@@ -1,4 +1,6 @@
 from concurrent.futures import as_completed
+from typing import Dict, List, Optional, Tuple
+import datetime
 
 from mcim_sync.utils.loger import log
 from mcim_sync.utils.constants import Platform
@@ -9,8 +11,12 @@ from mcim_sync.utils.telegram import (
     TagsNotification,
 )
 from mcim_sync.config import Config
+from mcim_sync.models import ProjectDetail
+from mcim_sync.models.database.modrinth import Translation
+from mcim_sync.utils.model_submitter import TranslationSubmitter
 from mcim_sync.sync.modrinth import (
     sync_project,
+    sync_projects_batch,
     sync_categories,
     sync_loaders,
     sync_game_versions,
@@ -20,55 +26,194 @@ from mcim_sync.checker.modrinth import (
     check_modrinth_project_ids_available,
     check_modrinth_version_ids_available,
     check_modrinth_hashes_available,
+    fetch_modrinth_projects_info,
     check_newest_search_result,
+    check_updated_search_result,
+)
+from mcim_sync.cursors.modrinth import (
+    get_modrinth_updated_watermark,
+    set_modrinth_updated_watermark,
 )
 from mcim_sync.cleaner.modrinth import remove_projects
 from mcim_sync.fetcher.modrinth import (
     fetch_expired_and_removed_modrinth_data,
     fetch_all_modrinth_data,
+    iter_modrinth_check_chunks,
+    check_expired_and_removed_modrinth_chunk,
+)
+from mcim_sync.queues.modrinth import (
+    ack_modrinth_all_queues,
+    add_modrinth_project_ids_queue,
+    modrinth_queues_pending,
+    promote_modrinth_retries,
+    reset_modrinth_project_ids_attempts,
+    retry_modrinth_project_ids,
 )
-from mcim_sync.queues.modrinth import clear_modrinth_all_queues
-from mcim_sync.tasks import create_tasks_pool
+from mcim_sync.tasks import create_tasks_pool, run_tasks_pipeline
 
 config = Config.load()
 
 MAX_WORKERS: int = config.max_workers
+CHECK_WORKERS: int = config.check_workers
+PIPELINE_QUEUE_SIZE: int = config.pipeline_queue_size
+MODRINTH_BATCH_VERSIONS: bool = config.modrinth_batch_versions
+QUEUE_MAX_BATCHES: int = config.queue_max_batches
+MODIFY_DATE_REFRESH_FULL: bool = config.modify_date_refresh_full
+
+
+def _sync_project_with_info(
+    projects_info: Dict[str, Optional[dict]],
+    translation_submitter: Optional[TranslationSubmitter] = None,
+    full: bool = False,
+):
+    """
+    返回使用已拉取 Project 信息的 sync_project，同步后释放对应的 Project 信息
+
+    同一任务中的 Project 共享 translation_submitter，翻译检查按批进行
+    """
+
+    def sync(project_id: str):
+        return sync_project(
+            project_id,
+            project_info=projects_info.pop(project_id, None),
+            full=full,
+            translation_submitter=translation_submitter,
+        )
+
+    return sync
+
+
+def _sync_new_projects(
+    project_ids: List[str],
+    projects_info: Dict[str, Optional[dict]],
+    thread_name_prefix: str,
+) -> List[ProjectDetail]:
+    """
+    同步新的 project，已有 Project 信息的跨 project 批量拉取版本，其余逐个 sync_project
+    """
+    projects_detail_info: List[ProjectDetail] = []
+    fallback_project_ids = project_ids
+    with TranslationSubmitter(Translation.__collection__) as translation_submitter:
+        if MODRINTH_BATCH_VERSIONS:
+            batch_projects = [
+                projects_info[project_id]
+                for project_id in project_ids
+                if projects_info.get(project_id) is not None
+            ]
+            batch_projects_detail_info, batch_fallback_project_ids = (
+                sync_projects_batch(batch_projects, translation_submitter)
+            )
+            projects_detail_info.extend(batch_projects_detail_info)
+            fallback_project_ids = batch_fallback_project_ids + [
+                project_id
+                for project_id in project_ids
+                if projects_info.get(project_id) is None
+            ]
+
+        if fallback_project_ids:
+            with create_tasks_pool(
+                _sync_project_with_info(projects_info, translation_submitter),
+                fallback_project_ids,
+                MAX_WORKERS,
+                thread_name_prefix,
+            ) as futures:
+                future_project_ids = dict(zip(futures, fallback_project_ids))
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        log.error(
+                            f"Failed to sync project {future_project_ids[future]}: {e}"
+                        )
+                        continue
+                    if result:
+                        projects_detail_info.append(result)
+
+    return projects_detail_info
 
 
 def refresh_modrinth_with_modify_date() -> bool:
     log.info("Start fetching expired Modrinth data.")
 
-    modrinth_expired_data, modrinth_removed_data = (
-        fetch_expired_and_removed_modrinth_data()
-    )
+    if config.refresh_pipeline:
+        modrinth_removed_data = []
+        expired_projects_info: Dict[str, Optional[dict]] = {}
 
-    log.info(
-        f"Modrinth expired data fetched: {len(modrinth_expired_data)}, removed data: {len(modrinth_removed_data)}"
-    )
+        def check_chunk(projects) -> List[str]:
+            expired_projects, removed_project_ids = (
+                check_expired_and_removed_modrinth_chunk(projects)
+            )
+            modrinth_removed_data.extend(removed_project_ids)
+            expired_projects_info.update(expired_projects)
+            return list(expired_projects)
+
+        log.info("Start syncing Modrinth expired data in pipeline...")
+        with TranslationSubmitter(Translation.__collection__) as translation_submitter:
+            results = run_tasks_pipeline(
+                iter_modrinth_check_chunks(),
+                check_chunk,
+                _sync_project_with_info(
+                    expired_projects_info,
+                    translation_submitter,
+                    full=MODIFY_DATE_REFRESH_FULL,
+                ),  # 需要 ProjectDetail 返回值
+                MAX_WORKERS,
+                "refresh_modrinth",
+                check_workers=CHECK_WORKERS,
+                queue_size=PIPELINE_QUEUE_SIZE,
+            )
+        modrinth_expired_data = [project_id for project_id, _ in results]
+        projects_detail_info = [result for _, result in results if result]
 
-    # 删除已经源删除的 modrinth 数据
-    if modrinth_removed_data:
-        log.info(f"Start removing modrinth data: {len(modrinth_removed_data)}")
-        remove_projects(modrinth_removed_data)
-        log.info(f"Removed {len(modrinth_removed_data)} modrinth data.")
-        log.debug(f"Modrinth removed data: {modrinth_removed_data}")
-
-    # 刷新过期的 modrinth 数据
-    log.info("Start syncing Modrinth expired data...")
-    with create_tasks_pool(
-        sync_project,  # 需要 ProjectDetail 返回值
-        modrinth_expired_data,
-        MAX_WORKERS,
-        "refresh_modrinth",
-    ) as modrinth_futures:
         log.info(
-            f"All {len(modrinth_futures)} tasks submitted, waiting for completion..."
+            f"Modrinth expired data synced: {len(modrinth_expired_data)}, removed data: {len(modrinth_removed_data)}"
         )
-        projects_detail_info = []
-        for future in as_completed(modrinth_futures):
-            result = future.result()
-            if result:
-                projects_detail_info.append(result)
+
+        # 删除已经源删除的 modrinth 数据
+        if modrinth_removed_data:
+            log.info(f"Start removing modrinth data: {len(modrinth_removed_data)}")
+            remove_projects(modrinth_removed_data)
+            log.info(f"Removed {len(modrinth_removed_data)} modrinth data.")
+            log.debug(f"Modrinth removed data: {modrinth_removed_data}")
+    else:
+        expired_projects_info, modrinth_removed_data = (
+            fetch_expired_and_removed_modrinth_data()
+        )
+        modrinth_expired_data = list(expired_projects_info)
+
+        log.info(
+            f"Modrinth expired data fetched: {len(modrinth_expired_data)}, removed data: {len(modrinth_removed_data)}"
+        )
+
+        # 删除已经源删除的 modrinth 数据
+        if modrinth_removed_data:
+            log.info(f"Start removing modrinth data: {len(modrinth_removed_data)}")
+            remove_projects(modrinth_removed_data)
+            log.info(f"Removed {len(modrinth_removed_data)} modrinth data.")
+            log.debug(f"Modrinth removed data: {modrinth_removed_data}")
+
+        # 刷新过期的 modrinth 数据
+        log.info("Start syncing Modrinth expired data...")
+        with TranslationSubmitter(
+            Translation.__collection__
+        ) as translation_submitter, create_tasks_pool(
+            _sync_project_with_info(
+                expired_projects_info,
+                translation_submitter,
+                full=MODIFY_DATE_REFRESH_FULL,
+            ),  # 需要 ProjectDetail 返回值
+            modrinth_expired_data,
+            MAX_WORKERS,
+            "refresh_modrinth",
+        ) as modrinth_futures:
+            log.info(
+                f"All {len(modrinth_futures)} tasks submitted, waiting for completion..."
+            )
+            projects_detail_info = []
+            for future in as_completed(modrinth_futures):
+                result = future.result()
+                if result:
+                    projects_detail_info.append(result)
 
     if config.telegram_bot:
         notification = RefreshNotification(
@@ -81,72 +226,194 @@ def refresh_modrinth_with_modify_date() -> bool:
     return True
 
 
-def fetch_modrinth_not_found_ids_from_queue():
+def refresh_modrinth_incremental() -> bool:
+    """
+    按 updated 索引搜索，只同步 date_modified 晚于上次水位线的 Project
+
+    全量的 refresh_modrinth_with_modify_date 作为每日一致性检查
+    """
+    log.info("Start fetching updated Modrinth projects by search.")
+
+    watermark = get_modrinth_updated_watermark()
+    if watermark is None:
+        # 首次运行没有水位线，从当前时间开始记录，之前的更新交给全量检查
+        set_modrinth_updated_watermark(datetime.datetime.utcnow())
+        log.info("Modrinth updated watermark initialized.")
+        return True
+
+    updated_project_ids, newest_date = check_updated_search_result(
+        watermark=watermark
+    )
+    updated_project_ids = list(set(updated_project_ids))
+    log.info(f"Modrinth updated project ids fetched: {len(updated_project_ids)}")
+
+    projects_detail_info = []
+    if updated_project_ids:
+        # 批量拉取 Project 信息，同步时不再逐个请求
+        projects_info: Dict[str, Optional[dict]] = fetch_modrinth_projects_info(
+            updated_project_ids
+        )
+        with TranslationSubmitter(
+            Translation.__collection__
+        ) as translation_submitter, create_tasks_pool(
+            _sync_project_with_info(projects_info, translation_submitter),
+            updated_project_ids,
+            MAX_WORKERS,
+            "refresh_modrinth_incremental",
+        ) as futures:
+            for future in as_completed(futures):
+                result = future.result()
+                if result:
+                    projects_detail_info.append(result)
+
+    # 失败的 Project 留给每日全量检查，水位线照常推进；
+    # 没有完整遍历到水位线时 newest_date 为 None，保留旧水位线
+    if newest_date is not None and newest_date > watermark:
+        set_modrinth_updated_watermark(newest_date)
+
+    failed_count = len(updated_project_ids) - len(projects_detail_info)
+    log.info(
+        f"Modrinth incremental refresh finished, total: {len(updated_project_ids)}, "
+        f"success: {len(projects_detail_info)}, failed: {failed_count}"
+    )
+
+    if config.telegram_bot and updated_project_ids:
+        notification = RefreshNotification(
+            platform=Platform.MODRINTH,
+            projects_detail_info=projects_detail_info,
+            failed_count=failed_count,
+        )
+        notification.send_to_telegram()
+        log.info("Modrinth refresh message sent to telegram.")
+
+    return True
+
+
+def fetch_modrinth_not_found_ids_from_queue() -> Dict[str, Optional[dict]]:
     """
     获取 modrinth 队列中的所有 project ids，检查是否真的存在
+
+    返回 project_id 及其 Project 信息，只从 version 和 hash 得到的为 None
     """
-    project_ids = []
-    avaliable_project_ids = check_modrinth_project_ids_available()
-    project_ids.extend(avaliable_project_ids)
+    projects_info: Dict[str, Optional[dict]] = {}
+    avaliable_projects_info = check_modrinth_project_ids_available()
+    projects_info.update(avaliable_projects_info)
     log.info(
-        f"Modrinth project ids queue available project_ids: {len(avaliable_project_ids)}"
+        f"Modrinth project ids queue available project_ids: {len(avaliable_projects_info)}"
     )
     avaliable_project_ids = check_modrinth_version_ids_available()
-    project_ids.extend(avaliable_project_ids)
+    projects_info.update(
+        {
+            project_id: None
+            for project_id in avaliable_project_ids
+            if project_id not in projects_info
+        }
+    )
     log.info(
         f"Modrinth version ids queue available project_ids: {len(avaliable_project_ids)}"
     )
     avaliable_project_ids = check_modrinth_hashes_available()
-    project_ids.extend(avaliable_project_ids)
+    projects_info.update(
+        {
+            project_id: None
+            for project_id in avaliable_project_ids
+            if project_id not in projects_info
+        }
+    )
     log.info(
         f"Modrinth hashes queue available project_ids: {len(avaliable_project_ids)}"
     )
-    return project_ids
+    return projects_info
 
 
-def sync_modrinth_queue() -> bool:
-    log.info("Start fetching modrinth queue.")
-
-    project_ids = fetch_modrinth_not_found_ids_from_queue()
-    project_ids = list(set(project_ids))
+def sync_modrinth_queue_batch() -> Tuple[List[str], List[ProjectDetail]]:
+    """
+    从各队列取出一批并同步，处理完成后确认；返回这一批的 project id 和同步结果
+    """
+    projects_info = fetch_modrinth_not_found_ids_from_queue()
+    project_ids = list(projects_info.keys())
     log.info(f"Total project ids: {len(project_ids)} to check.")
 
     # 只要新的 project ids
     new_project_ids = check_new_project_ids(project_ids=project_ids)
     log.info(f"New project ids: {new_project_ids}, count: {len(new_project_ids)}")
 
+    projects_detail_info = []
     if new_project_ids:
-        with (
-            create_tasks_pool(
-                # sync_project, project_ids, MAX_WORKERS, "modrinth"
-                sync_project,
-                new_project_ids,
-                MAX_WORKERS,
-                "sync_modrinth_by_queue",  # https://github.com/mcmod-info-mirror/mcim-sync/issues/2
-            ) as futures
-        ):
-            projects_detail_info = []
+        # version 和 hash 只给出 project_id，只为新的 project 批量拉取一次信息
+        missing_project_ids = [
+            project_id
+            for project_id in new_project_ids
+            if projects_info.get(project_id) is None
+        ]
+        if missing_project_ids:
+            projects_info.update(fetch_modrinth_projects_info(missing_project_ids))
+
+        projects_detail_info = _sync_new_projects(
+            new_project_ids,
+            projects_info,
+            "sync_modrinth_by_queue",  # https://github.com/mcmod-info-mirror/mcim-sync/issues/2
+        )
 
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    projects_detail_info.append(result)
+    # 只确认这一批取出的成员，期间新加入队列的留给下一批
+    ack_modrinth_all_queues()
+
+    # 失败的 project id 按失败次数延后重试，不再随队列一起丢弃
+    failed_project_ids = set(new_project_ids) - {
+        project.id for project in projects_detail_info
+    }
+    reset_modrinth_project_ids_attempts(
+        [
+            project_id
+            for project_id in project_ids
+            if project_id not in failed_project_ids
+        ]
+    )
+    if failed_project_ids:
+        dead_project_ids = retry_modrinth_project_ids(list(failed_project_ids))
+        log.info(
+            f"Failed project ids scheduled to retry: {failed_project_ids - set(dead_project_ids)}"
+        )
+        if dead_project_ids:
+            log.warning(f"Project ids exceeded max retry attempts: {dead_project_ids}")
 
-        log.info(f"Modrinth queue sync finished, total: {len(project_ids)}")
+    return project_ids, projects_detail_info
 
-        # clear queue
-        clear_modrinth_all_queues()
-        log.info("Modrinth queue cleared.")
 
-        if config.telegram_bot:
-            notice = QueueSyncNotification(
-                platform=Platform.MODRINTH,
-                projects_detail_info=projects_detail_info,
-                total_catached_count=len(project_ids),
-            )
-            notice.send_to_telegram()
+def sync_modrinth_queue() -> bool:
+    log.info("Start fetching modrinth queue.")
 
-            log.info("All Message sent to telegram.")
+    project_ids: List[str] = []
+    projects_detail_info: List[ProjectDetail] = []
+    promoted_count = promote_modrinth_retries()
+    if promoted_count:
+        log.info(f"{promoted_count} project ids due to retry moved back to queue")
+
+    for batch in range(QUEUE_MAX_BATCHES):
+        if not modrinth_queues_pending():
+            break
+        batch_project_ids, batch_projects_detail_info = sync_modrinth_queue_batch()
+        project_ids.extend(batch_project_ids)
+        projects_detail_info.extend(batch_projects_detail_info)
+        log.info(
+            f"Modrinth queue batch {batch + 1} finished, total: {len(batch_project_ids)}"
+        )
+    else:
+        log.info(
+            f"Reached queue max batches {QUEUE_MAX_BATCHES}, leaving the rest for next sync"
+        )
+
+    log.info(f"Modrinth queue sync finished, total: {len(project_ids)}")
+
+    if projects_detail_info and config.telegram_bot:
+        notice = QueueSyncNotification(
+            platform=Platform.MODRINTH,
+            projects_detail_info=projects_detail_info,
+            total_catached_count=len(project_ids),
+        )
+        notice.send_to_telegram()
+
+        log.info("All Message sent to telegram.")
 
     return True
 
@@ -159,22 +426,27 @@ def sync_modrinth_by_search():
     new_project_ids = check_newest_search_result()
     log.info(f"Modrinth project ids fetched: {len(new_project_ids)}")
     if new_project_ids:
-        with create_tasks_pool(
-            sync_project,
-            new_project_ids,
-            MAX_WORKERS,
-            "sync_modrinth_by_search",
-        ) as futures:
-            projects_detail_info = []
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    projects_detail_info.append(result)
+        projects_info: Dict[str, Optional[dict]] = (
+            fetch_modrinth_projects_info(new_project_ids)
+            if MODRINTH_BATCH_VERSIONS
+            else {}
+        )
+        projects_detail_info = _sync_new_projects(
+            new_project_ids, projects_info, "sync_modrinth_by_search"
+        )
 
         log.info(
             f"Modrinth sync new project by search finished, total: {len(new_project_ids)}"
         )
 
+        # 搜索游标已经越过这些 project，同步失败的放回队列由队列任务重试
+        failed_project_ids = set(new_project_ids) - {
+            project.id for project in projects_detail_info
+        }
+        if failed_project_ids:
+            add_modrinth_project_ids_queue(list(failed_project_ids))
+            log.info(f"Failed project ids added to queue: {failed_project_ids}")
+
         if config.telegram_bot:
             notice = SearchSyncNotification(
                 platform=Platform.MODRINTH,
@@ -217,8 +489,13 @@ def refresh_modrinth_full():
     modrinth_data = fetch_all_modrinth_data()
     log.info(f"Modrinth data totally fetched: {len(modrinth_data)}")
 
-    with create_tasks_pool(
-        sync_project, modrinth_data, MAX_WORKERS, "modrinth_refresh_full"
+    with TranslationSubmitter(
+        Translation.__collection__
+    ) as translation_submitter, create_tasks_pool(
+        _sync_project_with_info({}, translation_submitter, full=True),
+        modrinth_data,
+        MAX_WORKERS,
+        "modrinth_refresh_full",
     ) as modrinth_futures:
         log.info(
             f"All {len(modrinth_futures)} tasks submitted, waiting for completion..."
@@ -234,7 +511,7 @@ def refresh_modrinth_full():
 
     failed_count = len(modrinth_data) - len(success_project_ids)
     failed_project_ids = [
-        project.id for project in modrinth_data if project.id not in success_project_ids
+        project_id for project_id in modrinth_data if project_id not in success_project_ids
     ]
 
     log.info(
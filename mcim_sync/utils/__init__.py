@@ -1,4 +1,5 @@
-from typing import List, Optional
+from typing import List, Optional, Union
+import datetime
 
 
 def find_hash_in_curseforge_hashes(hashes: Optional[List[dict]], algo: int) -> Optional[str]:
@@ -10,4 +11,17 @@ def find_hash_in_curseforge_hashes(hashes: Optional[List[dict]], algo: int) -> O
     for _hash in hashes:
         if _hash["algo"] == algo:
             return _hash["value"]
-    return None
\ No newline at end of file
+    return None
+
+
+def parse_datetime(
+    value: Union[str, datetime.datetime, None]
+) -> Optional[datetime.datetime]:
+    """
+    统一为不带时区的 datetime，兼容 mongoimport 导入的旧数据中以字符串保存的时间
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value.replace(tzinfo=None)
@@ -0,0 +1,146 @@
+from typing import Any, Dict, Iterable, List, Optional, Set
+import datetime
+import json
+import os
+import threading
+import time
+
+from mcim_sync.database.mongodb import raw_mongo_client
+from mcim_sync.fetcher import iter_documents_by_id
+from mcim_sync.utils.loger import log
+from mcim_sync.config import Config
+
+config = Config.load()
+
+KNOWN_IDS_LOAD_CHUNK_SIZE = 10000
+KNOWN_IDS_REFRESH_INTERVAL: int = config.known_ids_refresh_interval
+KNOWN_IDS_SNAPSHOT_DIR: Optional[str] = config.known_ids_snapshot_dir
+
+
+class KnownIdIndex:
+    """
+    集合中已缓存 _id 的内存索引，用于判断搜索结果里哪些是新的 mod / project
+
+    首次使用时从数据库只投影 _id 全量加载，之后由 ModelSubmitter 写入和清理时维护；
+    其他进程写入的文档按 sync_at 定期补齐。只会漏记不会多记已删除的文档，
+    漏记最多导致一次多余的同步，不会漏掉新的 mod
+    """
+
+    def __init__(self, collection: str, snapshot_dir: Optional[str] = None):
+        self.collection = collection
+        self.snapshot_path = (
+            os.path.join(snapshot_dir, f"{collection}_ids.json")
+            if snapshot_dir
+            else None
+        )
+        self._ids: Set[Any] = set()
+        self._loaded_at: Optional[datetime.datetime] = None
+        self._refreshed_at: float = 0
+        self._lock = threading.Lock()
+
+    def _load_snapshot(self) -> bool:
+        if self.snapshot_path is None or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, "r") as fd:
+                snapshot = json.load(fd)
+            self._ids = set(snapshot["ids"])
+            self._loaded_at = datetime.datetime.fromisoformat(snapshot["saved_at"])
+        except Exception as e:
+            log.warning(f"Failed to load known ids snapshot {self.snapshot_path}: {e}")
+            return False
+        log.debug(
+            f"Loaded {len(self._ids)} known ids of {self.collection} from snapshot"
+        )
+        return True
+
+    def _save_snapshot(self):
+        if self.snapshot_path is None:
+            return
+        try:
+            temp_path = f"{self.snapshot_path}.tmp"
+            with open(temp_path, "w") as fd:
+                json.dump(
+                    {"saved_at": self._loaded_at.isoformat(), "ids": list(self._ids)},
+                    fd,
+                )
+            os.replace(temp_path, self.snapshot_path)
+        except Exception as e:
+            log.warning(f"Failed to save known ids snapshot {self.snapshot_path}: {e}")
+
+    def _load_all(self):
+        loaded_at = datetime.datetime.utcnow()
+        ids: Set[Any] = set()
+        for documents in iter_documents_by_id(
+            raw_mongo_client[self.collection],
+            KNOWN_IDS_LOAD_CHUNK_SIZE,
+            projection={"_id": 1},
+        ):
+            ids.update(document["_id"] for document in documents)
+        self._ids = ids
+        self._loaded_at = loaded_at
+        log.debug(f"Loaded {len(ids)} known ids of {self.collection} from database")
+
+    def _load_synced_since(self, since: datetime.datetime):
+        loaded_at = datetime.datetime.utcnow()
+        count = 0
+        for documents in iter_documents_by_id(
+            raw_mongo_client[self.collection],
+            KNOWN_IDS_LOAD_CHUNK_SIZE,
+            query_filter={"sync_at": {"$gte": since}},
+            projection={"_id": 1},
+        ):
+            self._ids.update(document["_id"] for document in documents)
+            count += len(documents)
+        self._loaded_at = loaded_at
+        log.trace(f"Refreshed {count} known ids of {self.collection} since {since}")
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded_at is None:
+                if self._load_snapshot():
+                    self._load_synced_since(self._loaded_at)
+                else:
+                    self._load_all()
+            elif time.monotonic() - self._refreshed_at >= KNOWN_IDS_REFRESH_INTERVAL:
+                self._load_synced_since(self._loaded_at)
+            else:
+                return
+            self._refreshed_at = time.monotonic()
+            self._save_snapshot()
+
+    def filter_unknown(self, ids: Iterable[Any]) -> List[Any]:
+        """返回不在索引中的 id，保持原顺序并去重"""
+        self._ensure_loaded()
+        unknown = []
+        seen = set()
+        with self._lock:
+            for _id in ids:
+                if _id not in self._ids and _id not in seen:
+                    seen.add(_id)
+                    unknown.append(_id)
+        return unknown
+
+    def add(self, ids: Iterable[Any]):
+        with self._lock:
+            # 尚未加载时无需记录，加载时会从数据库读到
+            if self._loaded_at is not None:
+                self._ids.update(ids)
+
+    def discard(self, ids: Iterable[Any]):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._ids.difference_update(ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+curseforge_known_modids = KnownIdIndex("curseforge_mods", KNOWN_IDS_SNAPSHOT_DIR)
+modrinth_known_project_ids = KnownIdIndex("modrinth_projects", KNOWN_IDS_SNAPSHOT_DIR)
+
+# ModelSubmitter 按 model 所在集合找到对应的索引
+KNOWN_ID_INDEXES: Dict[str, KnownIdIndex] = {
+    index.collection: index
+    for index in [curseforge_known_modids, modrinth_known_project_ids]
+}
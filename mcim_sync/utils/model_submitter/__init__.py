@@ -1,12 +1,16 @@
-from typing import List
+from typing import Any, Dict, List, Optional
 from odmantic import Model
+from pymongo import UpdateOne
 from enum import Enum
+import threading
 
-from mcim_sync.database.mongodb import sync_mongo_engine
+from mcim_sync.database.mongodb import sync_mongo_engine, raw_mongo_client
 from mcim_sync.utils.loger import log
+from mcim_sync.utils.known_ids import KNOWN_ID_INDEXES
 
 
 DEFAULT_SUBMITTER_BATCH_SIZE = 20
+DEFAULT_TRANSLATION_BATCH_SIZE = 100
 
 
 class Platform(Enum):
@@ -49,6 +53,7 @@ class ModelSubmitter:
             # 批量保存模型
             sync_mongo_engine.save_all(self.models)
             self.total_submitted += len(self.models)
+            self._update_known_ids()
             log.trace(
                 f"Saved {len(self.models)} models (total: {self.total_submitted})"
             )
@@ -58,6 +63,13 @@ class ModelSubmitter:
         finally:
             self.models.clear()
 
+    def _update_known_ids(self) -> None:
+        """把已保存的 mod / project 记入已缓存 id 索引"""
+        for model in self.models:
+            index = KNOWN_ID_INDEXES.get(type(model).__collection__)
+            if index is not None:
+                index.add([model.id])
+
     def close(self) -> None:
         """保存所有剩余模型并清理"""
         self.flush()
@@ -77,3 +89,101 @@ class ModelSubmitter:
     def total_count(self) -> int:
         """已保存的模型数量"""
         return self.total_submitted
+
+
+class TranslationSubmitter:
+    """
+    为 mcim_translate 批量检查 summary / description 是否有修改
+
+    每批只用一次 $in 查询读出 original，新增和标记 need_to_update 合并为一次 bulk_write；
+    可以在多个同步线程之间共享
+    """
+
+    def __init__(
+        self, collection: str, batch_size: int = DEFAULT_TRANSLATION_BATCH_SIZE
+    ):
+        self.collection = collection
+        self.originals: Dict[Any, Optional[str]] = {}
+        self.batch_size = batch_size
+        self.total_updated = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        if exc_type:
+            log.error(f"Error during translation submission: {exc_val}")
+            return False
+        return True
+
+    def add(self, id: Any, original: Optional[str]) -> None:
+        """添加待检查的原文"""
+        with self._lock:
+            self.originals[id] = original
+            if len(self.originals) < self.batch_size:
+                return
+            originals = self.originals
+            self.originals = {}
+        self._submit(originals)
+
+    def flush(self) -> None:
+        """强制检查当前批次"""
+        with self._lock:
+            originals = self.originals
+            self.originals = {}
+        self._submit(originals)
+
+    def _submit(self, originals: Dict[Any, Optional[str]]) -> None:
+        if not originals:
+            return
+
+        collection = raw_mongo_client[self.collection]
+        existing = {
+            doc["_id"]: doc.get("original")
+            for doc in collection.find(
+                {"_id": {"$in": list(originals.keys())}}, {"original": 1}
+            )
+        }
+
+        operations = []
+        for id, original in originals.items():
+            if id not in existing:
+                log.debug(f"{id} original not found, adding new translation")
+                operations.append(
+                    UpdateOne(
+                        {"_id": id},
+                        {
+                            "$set": {"original": original, "need_to_update": True},
+                            "$setOnInsert": {"translated": None, "translated_at": None},
+                        },
+                        upsert=True,
+                    )
+                )
+            elif existing[id] != original:
+                log.debug(f"{id} original changed, marking translation for update")
+                operations.append(
+                    UpdateOne(
+                        {"_id": id},
+                        {"$set": {"original": original, "need_to_update": True}},
+                    )
+                )
+
+        if operations:
+            try:
+                collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                log.error(f"Error updating translations: {e}")
+                raise
+        self.total_updated += len(operations)
+        log.trace(
+            f"Checked {len(originals)} translations, updated {len(operations)} (total: {self.total_updated})"
+        )
+
+    def close(self) -> None:
+        """检查所有剩余原文"""
+        self.flush()
+        log.trace(
+            f"TranslationSubmitter finished, total updated: {self.total_updated}"
+        )
@@ -0,0 +1,97 @@
+from typing import Any, Dict, Iterable, List
+import threading
+import time
+
+from mcim_sync.database._redis import sync_redis_engine
+from mcim_sync.queues.modrinth import HASH_ALGORITHMS
+from mcim_sync.utils.loger import log
+from mcim_sync.config import Config
+
+config = Config.load()
+
+NEGATIVE_CACHE_TTL: int = config.negative_cache_ttl
+NEGATIVE_CACHE_BUCKET: int = config.negative_cache_bucket
+
+
+class NegativeCache:
+    """
+    上游确认不存在的 id，避免 API 前端反复加入队列的无效 id 每次都请求上游
+
+    按时间分桶存入 Redis 集合，每个桶在最后一次写入 ttl 秒后整体过期；
+    查询时用 SMISMEMBER 批量检查仍可能存活的几个桶
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: int = NEGATIVE_CACHE_TTL,
+        bucket_seconds: int = NEGATIVE_CACHE_BUCKET,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.bucket_seconds = bucket_seconds
+        self._lookups = 0
+        self._hits = 0
+        self._lock = threading.Lock()
+
+    def _bucket_key(self, bucket: int) -> str:
+        return f"negative_cache:{self.name}:{bucket}"
+
+    def _current_bucket(self) -> int:
+        return int(time.time() // self.bucket_seconds)
+
+    def add(self, ids: Iterable[Any]):
+        ids = list(ids)
+        if not ids:
+            return
+        bucket = self._current_bucket()
+        with sync_redis_engine.pipeline(transaction=False) as pipe:
+            pipe.sadd(self._bucket_key(bucket), *ids)
+            pipe.expireat(
+                self._bucket_key(bucket), (bucket + 1) * self.bucket_seconds + self.ttl
+            )
+            pipe.execute()
+        log.debug(f"Negative cache {self.name} added {len(ids)} ids")
+
+    def filter(self, ids: Iterable[Any]) -> List[Any]:
+        """返回不在缓存中的 id，并记录命中率"""
+        ids = list(ids)
+        if not ids:
+            return ids
+
+        current_bucket = self._current_bucket()
+        # 只有最近 ttl 时间内的桶可能还没过期
+        buckets = range(
+            current_bucket - self.ttl // self.bucket_seconds - 1, current_bucket + 1
+        )
+        with sync_redis_engine.pipeline(transaction=False) as pipe:
+            for bucket in buckets:
+                pipe.smismember(self._bucket_key(bucket), ids)
+            results = pipe.execute()
+
+        cached = [any(members) for members in zip(*results)]
+        remaining = [_id for _id, hit in zip(ids, cached) if not hit]
+        hits = len(ids) - len(remaining)
+
+        with self._lock:
+            self._lookups += len(ids)
+            self._hits += hits
+        log.info(
+            f"Negative cache {self.name} hit {hits}/{len(ids)}, total hit rate: {self.hit_rate:.2%}"
+        )
+        return remaining
+
+    @property
+    def hit_rate(self) -> float:
+        return self._hits / self._lookups if self._lookups else 0.0
+
+
+curseforge_missing_modids = NegativeCache("curseforge_modids")
+curseforge_missing_fileids = NegativeCache("curseforge_fileids")
+curseforge_missing_fingerprints = NegativeCache("curseforge_fingerprints")
+modrinth_missing_project_ids = NegativeCache("modrinth_project_ids")
+modrinth_missing_version_ids = NegativeCache("modrinth_version_ids")
+modrinth_missing_hashes: Dict[str, NegativeCache] = {
+    algorithm: NegativeCache(f"modrinth_hashes_{algorithm}")
+    for algorithm in HASH_ALGORITHMS
+}
@@ -4,7 +4,11 @@ from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime
 import time
 
-from mcim_sync.database.mongodb import init_mongodb_syncengine
+from mcim_sync.database.mongodb import (
+    init_mongodb_syncengine,
+    init_mongodb_indexes,
+    migrate_legacy_sync_at,
+)
 from mcim_sync.database._redis import init_redis_syncengine
 from mcim_sync.utils.loger import log
 from mcim_sync.config import Config
@@ -12,6 +16,7 @@ from mcim_sync.tasks.modrinth import (
     sync_modrinth_queue,
     refresh_modrinth_full,
     refresh_modrinth_with_modify_date,
+    refresh_modrinth_incremental,
     refresh_modrinth_tags,
     sync_modrinth_by_search,
     
@@ -19,11 +24,13 @@ from mcim_sync.tasks.modrinth import (
 from mcim_sync.tasks.curseforge import (
     sync_curseforge_queue,
     refresh_curseforge_with_modify_date,
+    refresh_curseforge_incremental,
     refresh_curseforge_categories,
     sync_curseforge_by_search,
     sync_curseforge_full
 )
 from mcim_sync.tasks.misc import send_statistics_to_telegram
+from mcim_sync.tasks.consumer import QueueConsumer
 from mcim_sync.utils.constants import GAME_432_CLASSES_INFO, GAME_78022_CLASSES_INFO
 
 config = Config.load()
@@ -34,6 +41,9 @@ def main():
     init_mongodb_syncengine()
     init_redis_syncengine()
     log.info("MongoDB SyncEngine initialized.")
+    migrate_legacy_sync_at()
+    init_mongodb_indexes()
+    log.info("MongoDB indexes ensured.")
 
     # 创建调度器
     scheduler = BackgroundScheduler()
@@ -46,6 +56,25 @@ def main():
         )
         log.info(f"Next run time of curseforge_refresh: {curseforge_refresh_trigger.get_next_fire_time(None, datetime.now())}")
 
+    if config.job_config.curseforge_refresh_incremental:
+        curseforge_refresh_incremental_trigger_432 = CronTrigger.from_crontab(config.cron_trigger.curseforge_refresh_incremental) if config.use_cron else IntervalTrigger(seconds=config.interval.curseforge_refresh_incremental)
+        scheduler.add_job(
+            refresh_curseforge_incremental,
+            kwargs={"gameId": 432, "classes_info": GAME_432_CLASSES_INFO},
+            trigger=curseforge_refresh_incremental_trigger_432,
+            name="curseforge_refresh_incremental_432",
+        )
+        log.info(f"Next run time of curseforge_refresh_incremental_432: {curseforge_refresh_incremental_trigger_432.get_next_fire_time(None, datetime.now())}")
+
+        curseforge_refresh_incremental_trigger_78022 = CronTrigger.from_crontab(config.cron_trigger.curseforge_refresh_incremental) if config.use_cron else IntervalTrigger(seconds=config.interval.curseforge_refresh_incremental)
+        scheduler.add_job(
+            refresh_curseforge_incremental,
+            kwargs={"gameId": 78022, "classes_info": GAME_78022_CLASSES_INFO},
+            trigger=curseforge_refresh_incremental_trigger_78022,
+            name="curseforge_refresh_incremental_78022",
+        )
+        log.info(f"Next run time of curseforge_refresh_incremental_78022: {curseforge_refresh_incremental_trigger_78022.get_next_fire_time(None, datetime.now())}")
+
     if config.job_config.modrinth_refresh:
         modrinth_refresh_trigger = CronTrigger.from_crontab(config.cron_trigger.modrinth_refresh) if config.use_cron else IntervalTrigger(seconds=config.interval.modrinth_refresh)
         scheduler.add_job(
@@ -55,6 +84,15 @@ def main():
         )
         log.info(f"Next run time of modrinth_refresh: {modrinth_refresh_trigger.get_next_fire_time(None, datetime.now())}")
     
+    if config.job_config.modrinth_refresh_incremental:
+        modrinth_refresh_incremental_trigger = CronTrigger.from_crontab(config.cron_trigger.modrinth_refresh_incremental) if config.use_cron else IntervalTrigger(seconds=config.interval.modrinth_refresh_incremental)
+        scheduler.add_job(
+            refresh_modrinth_incremental,
+            trigger=modrinth_refresh_incremental_trigger,
+            name="modrinth_refresh_incremental",
+        )
+        log.info(f"Next run time of modrinth_refresh_incremental: {modrinth_refresh_incremental_trigger.get_next_fire_time(None, datetime.now())}")
+
     if config.job_config.curseforge_refresh_full:
         curseforge_full_refresh_trigger = CronTrigger.from_crontab(config.cron_trigger.curseforge_refresh_full) if config.use_cron else IntervalTrigger(seconds=config.interval.curseforge_refresh_full)
         scheduler.add_job(
@@ -73,7 +111,13 @@ def main():
         )
         log.info(f"Next run time of modrinth_full_refresh: {modrinth_full_refresh_trigger.get_next_fire_time(None, datetime.now())}")
 
-    if config.job_config.sync_curseforge_by_queue:
+    # 常驻消费者和定时队列任务共用 processing 集合，只启用其中一个
+    queue_consumer = None
+    if config.job_config.queue_consumer:
+        queue_consumer = QueueConsumer()
+        log.info("Queue consumer enabled, skip sync_curseforge_queue and sync_modrinth_queue jobs")
+
+    if config.job_config.sync_curseforge_by_queue and queue_consumer is None:
         curseforge_sync_trigger = CronTrigger.from_crontab(config.cron_trigger.sync_curseforge_by_queue) if config.use_cron else IntervalTrigger(seconds=config.interval.sync_curseforge_by_queue)
         scheduler.add_job(
             sync_curseforge_queue,
@@ -82,7 +126,7 @@ def main():
         )
         log.info(f"Next run time of sync_curseforge_queue: {curseforge_sync_trigger.get_next_fire_time(None, datetime.now())}")
 
-    if config.job_config.sync_modrinth_by_queue:
+    if config.job_config.sync_modrinth_by_queue and queue_consumer is None:
         modrinth_sync_trigger = CronTrigger.from_crontab(config.cron_trigger.sync_modrinth_by_queue) if config.use_cron else IntervalTrigger(seconds=config.interval.sync_modrinth_by_queue)
         scheduler.add_job(
             sync_modrinth_queue,
@@ -160,10 +204,15 @@ def main():
     scheduler.start()
     log.info("Scheduler started")
 
+    if queue_consumer is not None:
+        queue_consumer.start()
+
     try:
         while True:
             time.sleep(1)
     except (KeyboardInterrupt, SystemExit):
+        if queue_consumer is not None:
+            queue_consumer.stop()
         scheduler.shutdown()
         log.info("Scheduler shutdown")
 
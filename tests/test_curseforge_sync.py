@@ -1,5 +1,5 @@
 
-from mcim_sync.sync.curseforge import sync_mod, sync_categories
+from mcim_sync.sync.curseforge import sync_mod, sync_categories, fetch_mutil_mods_info
 from mcim_sync.models import ProjectDetail
 
 
@@ -9,6 +9,11 @@ def test_sync_mod():
     result = sync_mod(modId)
     assert isinstance(result, ProjectDetail)
 
+def test_sync_mod_with_mod_info():
+    mod_info = fetch_mutil_mods_info(modIds=[modId])[0]
+    result = sync_mod(modId, mod_info=mod_info)
+    assert isinstance(result, ProjectDetail)
+
 def test_sync_categories():
     result = sync_categories(gameId=432)
     assert isinstance(result, list)
@@ -3,6 +3,8 @@ from mcim_sync.sync.modrinth import (
     sync_categories,
     sync_loaders,
     sync_game_versions,
+    fetch_mutil_projects_info,
+    sync_projects_batch,
 )
 from mcim_sync.models import ProjectDetail
 
@@ -14,6 +16,18 @@ def test_sync_project():
     assert isinstance(result, ProjectDetail)
 
 
+def test_sync_project_with_project_info():
+    project_info = fetch_mutil_projects_info(project_ids=[project_id])[0]
+    result = sync_project(project_id, project_info=project_info)
+    assert isinstance(result, ProjectDetail)
+
+
+def test_sync_projects_batch():
+    projects = fetch_mutil_projects_info(project_ids=[project_id])
+    projects_detail_info, fallback_project_ids = sync_projects_batch(projects)
+    assert len(projects_detail_info) + len(fallback_project_ids) == len(projects)
+
+
 def test_sync_categories():
     result = sync_categories()
     assert isinstance(result, list)
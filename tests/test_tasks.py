@@ -3,11 +3,13 @@ from pytest import mark
 from mcim_sync.tasks.modrinth import (
     sync_modrinth_queue,
     refresh_modrinth_with_modify_date,
+    refresh_modrinth_incremental,
     sync_modrinth_by_search
 )
 from mcim_sync.tasks.curseforge import (
     sync_curseforge_queue,
     refresh_curseforge_with_modify_date,
+    refresh_curseforge_incremental,
     refresh_curseforge_categories,
     sync_curseforge_by_search
 )
@@ -25,10 +27,18 @@ def test_refresh_modrinth_with_modify_date():
     assert refresh_modrinth_with_modify_date()
 
 
+def test_refresh_modrinth_incremental():
+    assert refresh_modrinth_incremental()
+
+
 def test_refresh_curseforge_with_modify_date():
     assert refresh_curseforge_with_modify_date()
 
 
+def test_refresh_curseforge_incremental():
+    assert refresh_curseforge_incremental()
+
+
 def test_refresh_curseforge_categories():
     assert refresh_curseforge_categories()
 
@@ -0,0 +1,87 @@
+import threading
+
+from mcim_sync.tasks import run_tasks_pipeline
+
+
+def test_run_tasks_pipeline_delivers_all_items():
+    results = run_tasks_pipeline(
+        [[1, 2], [3], [4, 5]],
+        lambda chunk: chunk,
+        lambda item: item * 2,
+        max_workers=2,
+        thread_name_prefix="test_pipeline",
+    )
+    assert sorted(results) == [(1, 2), (2, 4), (3, 6), (4, 8), (5, 10)]
+
+
+def test_run_tasks_pipeline_check_stage_error():
+    def check(chunk):
+        if chunk == [3]:
+            raise ValueError("check failed")
+        return chunk
+
+    results = run_tasks_pipeline(
+        [[1, 2], [3], [4]],
+        check,
+        lambda item: item,
+        max_workers=2,
+        thread_name_prefix="test_pipeline",
+        check_workers=2,
+    )
+    # 出错的块被跳过，其他块照常同步
+    assert sorted(results) == [(1, 1), (2, 2), (4, 4)]
+
+
+def test_run_tasks_pipeline_sync_stage_error():
+    def sync(item):
+        if item == 2:
+            raise ValueError("sync failed")
+        return item
+
+    results = run_tasks_pipeline(
+        [[1, 2, 3]],
+        lambda chunk: chunk,
+        sync,
+        max_workers=2,
+        thread_name_prefix="test_pipeline",
+    )
+    # 同步出错的 item 结果为 None
+    assert sorted(results, key=lambda result: result[0]) == [(1, 1), (2, None), (3, 3)]
+
+
+def test_run_tasks_pipeline_fetch_stage_error():
+    def source():
+        yield [1, 2]
+        raise ValueError("fetch failed")
+
+    results = run_tasks_pipeline(
+        source(),
+        lambda chunk: chunk,
+        lambda item: item,
+        max_workers=2,
+        thread_name_prefix="test_pipeline",
+    )
+    # 拉取中断前的块照常同步，流水线正常结束
+    assert sorted(results) == [(1, 1), (2, 2)]
+
+
+def test_run_tasks_pipeline_unique():
+    synced = []
+    lock = threading.Lock()
+
+    def sync(item):
+        with lock:
+            synced.append(item)
+        return item
+
+    results = run_tasks_pipeline(
+        [[1, 2], [2, 3], [3, 1]],
+        lambda chunk: chunk,
+        sync,
+        max_workers=4,
+        thread_name_prefix="test_pipeline",
+        check_workers=3,
+        unique=True,
+    )
+    assert sorted(synced) == [1, 2, 3]
+    assert sorted(results) == [(1, 1), (2, 2), (3, 3)]